@@ -8,6 +8,7 @@ import os
 
 from rcognita.controllers import CtrlKinematic
 from rcognita.systems import Sys3WRobot
+from rcognita.sweeps import run_sweep
 
 # Create output folder
 os.makedirs("kinematic_results", exist_ok=True)
@@ -48,45 +49,35 @@ gain_sets = {
     "set10": {"k_rho": 3.0, "k_alpha": 7.5, "k_beta": -5.5}
 }
 
-# Store all trajectories for comparison
-plt.figure()
-for label, gains in gain_sets.items():
-    print(f"Running simulation {label}...")
-    ctrl = CtrlKinematic(
-        k_rho=gains["k_rho"],
-        k_alpha=gains["k_alpha"],
-        k_beta=gains["k_beta"],
-        ctrl_bnds=np.array([[0.0, 1.0], [-1.0, 1.0]]),
-        t0=0.0,
-        sampling_time=sampling_time
-    )
+# Run all gain sets in parallel, then plot
+ctrl_pars = {label: dict(gains,
+                         ctrl_bnds=np.array([[0.0, 1.0], [-1.0, 1.0]]),
+                         t0=0.0,
+                         sampling_time=sampling_time)
+             for label, gains in gain_sets.items()}
 
-    x = x0.copy()
-    t = 0.0
-    x_log = [x.copy()]
+if __name__ == "__main__":
+    print("Running simulations " + ", ".join(gain_sets) + "...")
+    results = run_sweep(CtrlKinematic, ctrl_pars,
+                        episode_kwargs={"state_init": x0, "state_goal": x_goal,
+                                        "sampling_time": sampling_time, "t1": Tfinal})
 
-    while t <= Tfinal:
-        observation = np.concatenate([x, x_goal])
-        u = ctrl.compute_action(t, observation)
-        x = x + sampling_time * np.array([
-            u[0] * np.cos(x[2]),
-            u[0] * np.sin(x[2]),
-            u[1]
-        ])
-        x_log.append(x.copy())
-        t += sampling_time
+    # Store all trajectories for comparison
+    plt.figure()
+    for result in results:
+        if result.error is not None:
+            continue
+        x_log = result.data["state"]
+        plt.plot(x_log[:, 0], x_log[:, 1], label=result.label)
 
-    x_log = np.array(x_log)
-    plt.plot(x_log[:, 0], x_log[:, 1], label=label)
+    # Plot goal
+    plt.plot(x_goal[0], x_goal[1], 'ro', label="Goal")
+    plt.xlabel("X [m]")
+    plt.ylabel("Y [m]")
+    plt.title("Kinematic Trajectories - All Gain Sets")
+    plt.legend()
+    plt.grid()
+    plt.savefig("kinematic_results/all_trajectories.png")
+    plt.show()
 
-# Plot goal
-plt.plot(x_goal[0], x_goal[1], 'ro', label="Goal")
-plt.xlabel("X [m]")
-plt.ylabel("Y [m]")
-plt.title("Kinematic Trajectories - All Gain Sets")
-plt.legend()
-plt.grid()
-plt.savefig("kinematic_results/all_trajectories.png")
-plt.show()
-
-print("\n Kinematic simulation summary complete. All trajectories saved in one figure.")
\ No newline at end of file
+    print("\n Kinematic simulation summary complete. All trajectories saved in one figure.")
\ No newline at end of file
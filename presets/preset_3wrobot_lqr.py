@@ -2,7 +2,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 from rcognita.controllers import CtrlLQR
-from rcognita.systems import Sys3WRobot
+from rcognita.systems import Sys3WRobot, Sys3WRobotNI
+from rcognita.sweeps import run_sweep
 
 # === Create result folder ===
 os.makedirs("lqr_results", exist_ok=True)
@@ -13,18 +14,14 @@ Tfinal = 20.0
 x0 = np.array([0.0, 0.0, 0.0])
 x_goal = np.array([2.0, 2.0, 0.0])
 
-# === Manually define linearized unicycle system matrices (at θ = 0) ===
-A = np.array([
-    [1.0, 0.0, -sampling_time],
-    [0.0, 1.0,  sampling_time],
-    [0.0, 0.0,  1.0]
-])
-
-B = np.array([
-    [sampling_time, 0.0],
-    [0.0,           0.0],
-    [0.0,    sampling_time]
-])
+# === Exact discrete-time linearization of the unicycle (at θ = 0, moving forward with v = 1) ===
+A, B = Sys3WRobotNI(
+    sys_type="diff_eqn",
+    dim_state=3,
+    dim_input=2,
+    dim_output=3,
+    dim_disturb=0
+).linearize_discr(np.array([0.0, 0.0, 0.0]), np.array([1.0, 0.0]), sampling_time)
 
 # === Initialize system for consistency ===
 system = Sys3WRobot(
@@ -50,21 +47,16 @@ lqr_sets = {
     "set10": {"Q": np.diag([25, 25, 5.0]), "R": np.diag([0.01, 0.01])}  # Optimized
 }
 
-# === For final combined plot ===
-plt.figure(figsize=(8, 6))
-
-# === Run simulations ===
-for label, params in lqr_sets.items():
-    ctrl = CtrlLQR(A, B, Q=params["Q"], R=params["R"], sampling_time=sampling_time)
-
-    x = x0.copy()
+# === Episode routine: state-error feedback of the LQR gain ===
+def rollout_lqr(ctrl, state_init, state_goal, sampling_time, t1):
+    x = state_init.copy()
     t = 0.0
     x_log = [x.copy()]
     u_log = []
     t_log = [t]
 
-    while t < Tfinal:
-        state_error = x - x_goal
+    while t < t1:
+        state_error = x - state_goal
         u = ctrl.compute_action(state_error)
 
         v = np.clip(u[0], 0.0, 1.0)
@@ -81,56 +73,74 @@ for label, params in lqr_sets.items():
         t += sampling_time
         t_log.append(t)
 
-    x_log = np.array(x_log)
-    u_log = np.array(u_log)
-    t_log = np.array(t_log[:-1])
-
-    # === Plot 1: Trajectory ===
-    plt.figure()
-    plt.plot(x_log[:, 0], x_log[:, 1], label="Trajectory")
-    plt.plot(x_goal[0], x_goal[1], "ro", label="Goal")
+    return {"t": np.array(t_log[:-1]), "state": np.array(x_log), "action": np.array(u_log)}
+
+# === Run all parameter sets in parallel, then plot ===
+ctrl_pars = {label: dict(params, A=A, B=B, sampling_time=sampling_time) for label, params in lqr_sets.items()}
+
+if __name__ == "__main__":
+    results = run_sweep(CtrlLQR, ctrl_pars, episode_fnc=rollout_lqr,
+                        episode_kwargs={"state_init": x0, "state_goal": x_goal,
+                                        "sampling_time": sampling_time, "t1": Tfinal})
+
+    # === For final combined plot ===
+    plt.figure(figsize=(8, 6))
+
+    for result in results:
+        if result.error is not None:
+            continue
+
+        label = result.label
+        x_log = result.data["state"]
+        u_log = result.data["action"]
+        t_log = result.data["t"]
+
+        # === Plot 1: Trajectory ===
+        plt.figure()
+        plt.plot(x_log[:, 0], x_log[:, 1], label="Trajectory")
+        plt.plot(x_goal[0], x_goal[1], "ro", label="Goal")
+        plt.xlabel("X [m]")
+        plt.ylabel("Y [m]")
+        plt.title(f"LQR Trajectory ({label})")
+        plt.legend()
+        plt.grid()
+        plt.savefig(f"lqr_results/lqr_traj_{label}.png")
+        plt.close()
+
+        # Add to combined plot
+        plt.figure(1)
+        plt.plot(x_log[:, 0], x_log[:, 1], label=label)
+
+        # === Plot 2: Orientation ===
+        plt.figure()
+        plt.plot(t_log, x_log[:-1, 2])
+        plt.xlabel("Time [s]")
+        plt.ylabel("Theta [rad]")
+        plt.title(f"Orientation Over Time ({label})")
+        plt.grid()
+        plt.savefig(f"lqr_results/lqr_orient_{label}.png")
+        plt.close()
+
+        # === Plot 3: Controls ===
+        plt.figure()
+        plt.plot(t_log, u_log[:, 0], label="v (linear)")
+        plt.plot(t_log, u_log[:, 1], label="omega (angular)")
+        plt.xlabel("Time [s]")
+        plt.ylabel("Control Inputs")
+        plt.title(f"Control Inputs Over Time ({label})")
+        plt.legend()
+        plt.grid()
+        plt.savefig(f"lqr_results/lqr_control_{label}.png")
+        plt.close()
+
+    # Save combined plot
+    plt.figure(1)
+    plt.plot(x_goal[0], x_goal[1], 'ro', label='Goal')
     plt.xlabel("X [m]")
     plt.ylabel("Y [m]")
-    plt.title(f"LQR Trajectory ({label})")
+    plt.title("All LQR Trajectories")
     plt.legend()
     plt.grid()
-    plt.savefig(f"lqr_results/lqr_traj_{label}.png")
-    plt.close()
+    plt.savefig("lqr_results/lqr_all_trajectories.png")
 
-    # Add to combined plot
-    plt.figure(1)
-    plt.plot(x_log[:, 0], x_log[:, 1], label=label)
-
-    # === Plot 2: Orientation ===
-    plt.figure()
-    plt.plot(t_log, x_log[:-1, 2])
-    plt.xlabel("Time [s]")
-    plt.ylabel("Theta [rad]")
-    plt.title(f"Orientation Over Time ({label})")
-    plt.grid()
-    plt.savefig(f"lqr_results/lqr_orient_{label}.png")
-    plt.close()
-
-    # === Plot 3: Controls ===
-    plt.figure()
-    plt.plot(t_log, u_log[:, 0], label="v (linear)")
-    plt.plot(t_log, u_log[:, 1], label="omega (angular)")
-    plt.xlabel("Time [s]")
-    plt.ylabel("Control Inputs")
-    plt.title(f"Control Inputs Over Time ({label})")
-    plt.legend()
-    plt.grid()
-    plt.savefig(f"lqr_results/lqr_control_{label}.png")
-    plt.close()
-
-# Save combined plot
-plt.figure(1)
-plt.plot(x_goal[0], x_goal[1], 'ro', label='Goal')
-plt.xlabel("X [m]")
-plt.ylabel("Y [m]")
-plt.title("All LQR Trajectories")
-plt.legend()
-plt.grid()
-plt.savefig("lqr_results/lqr_all_trajectories.png")
-
-print("LQR simulations complete. All 10 result sets and combined plot saved in 'lqr_results/' folder.")
+    print("LQR simulations complete. All 10 result sets and combined plot saved in 'lqr_results/' folder.")
@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 import os
 from rcognita.controllers import CtrlMPC
 from rcognita.systems import Sys3WRobot
+from rcognita.sweeps import run_sweep
 
 # === Create results folder ===
 os.makedirs("mpc_results", exist_ok=True)
@@ -38,89 +39,72 @@ mpc_sets = {
 }
 
 
-# === Combined plot setup ===
-plt.figure(figsize=(8, 6))
-
-# === Run simulations ===
-for label, params in mpc_sets.items():
-    print(f"Running simulation {label}...")
-    ctrl = CtrlMPC(
-        N=params["N"],
-        Q=params["Q"],
-        R=params["R"],
-        Qf=params["Qf"],
-        sampling_time=sampling_time
-    )
-
-    x = x0.copy()
-    t = 0.0
-    x_log = [x.copy()]
-    u_log = []
-    t_log = [t]
-
-    while t < Tfinal:
-        obs = np.concatenate([x, x_goal])
-        u = ctrl.compute_action(t, obs)
-
-        v, omega = u
-        theta = x[2]
-        x[0] += sampling_time * v * np.cos(theta)
-        x[1] += sampling_time * v * np.sin(theta)
-        x[2] += sampling_time * omega
-
-        x_log.append(x.copy())
-        u_log.append(u.copy())
-        t += sampling_time
-        t_log.append(t)
-
-    x_log = np.array(x_log)
-    u_log = np.array(u_log)
-    t_log = np.array(t_log[:-1])
-
-    # === Individual Plots ===
-    plt.figure()
-    plt.plot(x_log[:, 0], x_log[:, 1], label='Trajectory')
+# === Run all parameter sets in parallel (one CtrlMPC per worker), then plot ===
+# Built solvers are cached on disk, so that reruns of the sweep skip the symbolic construction
+ctrl_pars = {label: dict(params, sampling_time=sampling_time, cache_dir="mpc_results/solver_cache") for label, params in mpc_sets.items()}
+
+if __name__ == "__main__":
+    print("Running simulations " + ", ".join(mpc_sets) + "...")
+    results = run_sweep(CtrlMPC, ctrl_pars,
+                        episode_kwargs={"state_init": x0, "state_goal": x_goal,
+                                        "sampling_time": sampling_time, "t1": Tfinal})
+
+    # === Combined plot setup ===
+    plt.figure(figsize=(8, 6))
+
+    for result in results:
+        if result.error is not None:
+            continue
+
+        label = result.label
+        x_log = result.data["state"]
+        u_log = result.data["action"]
+        t_log = result.data["t"]
+
+        # === Individual Plots ===
+        plt.figure()
+        plt.plot(x_log[:, 0], x_log[:, 1], label='Trajectory')
+        plt.plot(x_goal[0], x_goal[1], 'ro', label='Goal')
+        plt.xlabel("X [m]")
+        plt.ylabel("Y [m]")
+        plt.title(f"MPC Trajectory ({label})")
+        plt.legend()
+        plt.grid()
+        plt.savefig(f"mpc_results/mpc_traj_{label}.png")
+        plt.close()
+
+        plt.figure()
+        plt.plot(t_log, x_log[:-1, 2])
+        plt.xlabel("Time [s]")
+        plt.ylabel("Theta [rad]")
+        plt.title(f"Orientation Over Time ({label})")
+        plt.grid()
+        plt.savefig(f"mpc_results/mpc_orient_{label}.png")
+        plt.close()
+
+        plt.figure()
+        plt.plot(t_log, u_log[:, 0], label="v (linear)")
+        plt.plot(t_log, u_log[:, 1], label="omega (angular)")
+        plt.xlabel("Time [s]")
+        plt.ylabel("Control Inputs")
+        plt.title(f"Control Inputs Over Time ({label})")
+        plt.legend()
+        plt.grid()
+        plt.savefig(f"mpc_results/mpc_control_{label}.png")
+        plt.close()
+
+        # === Add to combined plot ===
+        plt.figure(1)
+        plt.plot(x_log[:, 0], x_log[:, 1], label=label)
+
+    # === Final combined trajectory plot ===
     plt.plot(x_goal[0], x_goal[1], 'ro', label='Goal')
     plt.xlabel("X [m]")
     plt.ylabel("Y [m]")
-    plt.title(f"MPC Trajectory ({label})")
+    plt.title("MPC All Trajectories")
     plt.legend()
     plt.grid()
-    plt.savefig(f"mpc_results/mpc_traj_{label}.png")
+    plt.savefig("mpc_results/mpc_all_trajectories.png")
     plt.close()
 
-    plt.figure()
-    plt.plot(t_log, x_log[:-1, 2])
-    plt.xlabel("Time [s]")
-    plt.ylabel("Theta [rad]")
-    plt.title(f"Orientation Over Time ({label})")
-    plt.grid()
-    plt.savefig(f"mpc_results/mpc_orient_{label}.png")
-    plt.close()
-
-    plt.figure()
-    plt.plot(t_log, u_log[:, 0], label="v (linear)")
-    plt.plot(t_log, u_log[:, 1], label="omega (angular)")
-    plt.xlabel("Time [s]")
-    plt.ylabel("Control Inputs")
-    plt.title(f"Control Inputs Over Time ({label})")
-    plt.legend()
-    plt.grid()
-    plt.savefig(f"mpc_results/mpc_control_{label}.png")
-    plt.close()
-
-    # === Add to combined plot ===
-    plt.figure(1)
-    plt.plot(x_log[:, 0], x_log[:, 1], label=label)
-
-# === Final combined trajectory plot ===
-plt.plot(x_goal[0], x_goal[1], 'ro', label='Goal')
-plt.xlabel("X [m]")
-plt.ylabel("Y [m]")
-plt.title("MPC All Trajectories")
-plt.legend()
-plt.grid()
-plt.savefig("mpc_results/mpc_all_trajectories.png")
-plt.close()
-
-print("\n MPC simulations complete. All plots saved in 'mpc_results/' folder.")
\ No newline at end of file
+    print("\n MPC simulations complete. All plots saved in 'mpc_results/' folder.")
\ No newline at end of file
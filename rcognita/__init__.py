@@ -7,4 +7,5 @@ from . import systems
 from . import loggers
 from . import visuals
 from . import utilities
-from . import models
\ No newline at end of file
+from . import models
+from . import sweeps
\ No newline at end of file
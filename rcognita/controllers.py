@@ -16,7 +16,10 @@ Remarks:
 from .utilities import dss_sim
 from .utilities import rep_mat
 from .utilities import uptria2vec
+from .utilities import FeatureMap
 from .utilities import push_vec
+from .utilities import CtrlStats
+from .loggers import ConsoleReporter
 from . import models
 import numpy as np
 import scipy as sp
@@ -27,6 +30,8 @@ from scipy.optimize import NonlinearConstraint
 from numpy.linalg import lstsq
 from numpy import reshape
 import warnings
+import time
+from collections import OrderedDict
 
 # For debugging purposes
 from tabulate import tabulate
@@ -90,6 +95,9 @@ class CtrlRLStab:
     ----------
     mode : : string
         Controller mode. Currently available only JACS, joint actor-critic (stabilizing).   
+    stats : : :class:`~utilities.CtrlStats`
+        Per-sample statistics: wall time, iterations and function evaluations of the joint actor-critic optimizer, its status and cost.
+        The status is 1 if the safety checker rejected the optimizer's solution.
     
     Read more
     ---------
@@ -230,6 +238,8 @@ class CtrlRLStab:
         self.ctrl_clock = t0
         self.sampling_time = sampling_time
         
+        self.stats = CtrlStats()
+        
         # Controller: common
         self.Nactor = Nactor 
         self.pred_step_size = pred_step_size
@@ -320,6 +330,9 @@ class CtrlRLStab:
             self.dim_actor_per_input = self.dim_output
           
         self.dim_actor = self.dim_actor_per_input * self.dim_input   
+        
+        self.actor_features = FeatureMap(self.actor_struct, self.dim_output)
+        self.critic_features = FeatureMap(self.critic_struct, self.dim_output)
             
         self.Hmin = -0.5e1*np.ones(self.dim_actor) 
         self.Hmax = 0.5e1*np.ones(self.dim_actor)   
@@ -385,12 +398,7 @@ class CtrlRLStab:
 
         """
 
-        if self.actor_struct == 'quad-lin':
-            regressor_actor = np.concatenate([ uptria2vec( np.outer(observation, observation) ), observation ])
-        elif self.actor_struct == 'quadratic':
-            regressor_actor = np.concatenate([ uptria2vec( np.outer(observation, observation) ) ])   
-        elif self.actor_struct == 'quad-nomix':
-            regressor_actor = observation * observation        
+        regressor_actor = self.actor_features(observation)
 
         return reshape(w_actor, (self.dim_input, self.dim_actor_per_input)) @ regressor_actor
 
@@ -409,12 +417,7 @@ class CtrlRLStab:
         else:
             chi = observation - self.observation_target
         
-        if self.critic_struct == 'quad-lin':
-            regressor_critic = np.concatenate([ uptria2vec( np.outer(chi, chi) ), chi ])
-        elif self.critic_struct == 'quadratic':
-            regressor_critic = np.concatenate([ uptria2vec( np.outer(chi, chi) ) ])   
-        elif self.critic_struct == 'quad-nomix':
-            regressor_critic = chi * chi
+        regressor_critic = self.critic_features(chi)
 
         return lmbd * w_critic @ regressor_critic + ( 1 - lmbd ) * self.safe_ctrl.compute_LF( observation )
 
@@ -426,12 +429,7 @@ class CtrlRLStab:
 
         """
         
-        if self.actor_struct == 'quad-lin':
-            regressor_actor = np.concatenate([ uptria2vec( np.outer(observation, observation) ), observation ])
-        elif self.actor_struct == 'quadratic':
-            regressor_actor = np.concatenate([ uptria2vec( np.outer(observation, observation) ) ])   
-        elif self.actor_struct == 'quad-nomix':
-            regressor_actor = observation * observation          
+        regressor_actor = self.actor_features(observation)
         
         return reshape(lstsq( np.array( [ regressor_actor ] ), np.array( [ action ] ) )[0].T, self.dim_actor ) 
 
@@ -582,11 +580,16 @@ class CtrlRLStab:
         #                     np.hstack([self.w_critic_init,np.array([self.lmbd_init]),self.w_actor_init]),
         #                     method=opt_method, tol=1e-4, constraints=my_constraints, options=opt_options).x
         
-        w_all = minimize(self._actor_critic_cost,
-                            np.hstack([self.w_critic_init,np.array([self.lmbd_init]),self.w_actor_init]),
-                            method=opt_method,
-                            tol=1e-4,
-                            options=opt_options).x        
+        opt_result = minimize(self._actor_critic_cost,
+                              np.hstack([self.w_critic_init,np.array([self.lmbd_init]),self.w_actor_init]),
+                              method=opt_method,
+                              tol=1e-4,
+                              options=opt_options)
+        
+        w_all = opt_result.x
+        
+        # Iterations, function evaluations, status and cost for the statistics
+        self.opt_info = (opt_result.get('nit', np.nan), opt_result.get('nfev', np.nan), 0 if opt_result.success else 2, opt_result.fun)
         
         w_critic = w_all[:self.dim_critic]
         lmbd = w_all[self.dim_critic]
@@ -617,6 +620,8 @@ class CtrlRLStab:
             action = self.safe_ctrl.compute_action_vanila( observation )
             
             w_actor = self._w_actor_from_action( action, observation )
+            
+            self.opt_info = self.opt_info[:2] + (1, self.opt_info[3])
        
         # DEBUG ===================================================================   
         # ================================Put safe controller through        
@@ -656,6 +661,8 @@ class CtrlRLStab:
         time_in_sample = t - self.ctrl_clock
         
         if time_in_sample >= self.sampling_time: # New sample
+            tic = time.perf_counter()
+            
             # Update controller's internal clock
             self.ctrl_clock = t
             
@@ -672,6 +679,8 @@ class CtrlRLStab:
                 action[k] = np.clip(action[k], self.action_min[k], self.action_max[k]) 
 
             self.action_curr = action
+            
+            self.stats.record(time.perf_counter() - tic, *self.opt_info)
 
             return action
         
@@ -728,6 +737,15 @@ class CtrlOptPred:
         The latter could be, for instance, the true model of the system.
         In turn, ``state_sys`` represents the (true) current state of the system and should be updated accordingly.
         Parameters ``sys_rhs, sys_out, state_sys`` are used in those controller modes which rely on them.
+    sys_rhs_batch : : function
+        Batched counterpart of ``sys_rhs`` called as ``sys_rhs_batch([], states, actions)`` with arrays of shape ``[B, dim_state]``, resp., ``[B, dim_input]``,
+        e.g., ``my_sys._state_dyn_batch`` for a system ``my_sys``, see :func:`~systems.System._state_dyn_batch`.
+        Used to predict a batch of action sequences at once, see :func:`~controllers.CtrlOptPred._actor_cost_batch`. In this case, ``sys_out`` should accept batches of states as well.
+        If empty, ``sys_rhs`` is called for each sequence of the batch.
+    sys_rhs_jacs : : list of functions
+        Jacobians of ``sys_rhs`` with respect to state and action, called as ``sys_rhs_jacs[0]([], state, action)``, resp., ``sys_rhs_jacs[1]([], state, action)``,
+        e.g., ``[my_sys.jacobian_state, my_sys.jacobian_action]``.
+        If passed, the gradient of the actor cost is computed exactly, see :func:`~controllers.CtrlOptPred._actor_cost_grad`. This assumes that the observation equals the state.
     prob_noise_pow : : number
         Power of probing noise during an initial phase to fill the estimator's buffer before applying optimal control.   
     is_est_model : : number
@@ -761,6 +779,11 @@ class CtrlOptPred:
         optimal infinite-horizon cost (a.k.a. the value function). The temporal errors are stacked up using the said buffer.
     critic_period : : number
         The same meaning as ``model_est_period``. 
+    critic_opt_method : : string
+        Method of the critic's optimizer: 'lsq' - bounded linear least squares, see :func:`~controllers.CtrlOptPred._critic_optimizer`,
+        or a method of ``scipy.optimize.minimize`` that respects bounds, e.g., 'SLSQP'.
+    critic_reg : : number
+        Weight of the regularization of the critic's weights towards ``w_critic_init`` in the mode 'lsq'. Makes the least-squares problem well-posed if ``Ncritic`` is small compared to the number of critic's weights.
     critic_struct : : natural number
         Choice of the structure of the critic's features.
         
@@ -803,6 +826,18 @@ class CtrlOptPred:
         *Pass correct stage objective parameters in* ``stage_obj_pars`` *(as a list)*
         
         *When customizing the stage objective, add your specification into the table above*
+    is_warm_start : : number
+        Flag to initialize the actor's optimizer at each sample with the previous optimal action sequence shifted by one step (receding-horizon warm start).
+        Otherwise, the optimizer is always initialized with ``action_init`` repeated along the horizon.
+    warm_start_pad : : string
+        How to fill in the last action of the shifted sequence: 'last' - repeat the last action, 'nominal' - action of ``ctrl_nominal`` at the predicted last observation.
+    ctrl_nominal : : object
+        Nominal controller with a method ``compute_action_vanila(observation)``, e.g., :class:`~controllers.CtrlNominal3WRobotNI`. Used if ``warm_start_pad = 'nominal'``.
+    actor_opt_stats : : dict
+        Statistics of the actor's optimizer accumulated over samples: numbers of runs, iterations, cost and gradient evaluations, and the iterations of the last run.
+    stats : : :class:`~utilities.CtrlStats`
+        Per-sample statistics: wall time (including the critic update), iterations and cost evaluations of the actor's optimizer, its status and the actor cost.
+        Samples of the model estimation phase with probing noise are not recorded.
         
     References
     ----------
@@ -823,6 +858,8 @@ class CtrlOptPred:
                  sys_rhs=[],
                  sys_out=[],
                  state_sys=[],
+                 sys_rhs_batch=[],
+                 sys_rhs_jacs=[],
                  prob_noise_pow = 1,
                  is_est_model=0,
                  model_est_stage=1,
@@ -833,10 +870,15 @@ class CtrlOptPred:
                  gamma=1,
                  Ncritic=4,
                  critic_period=0.1,
+                 critic_opt_method='lsq',
+                 critic_reg=1e-6,
                  critic_struct='quad-nomix',
                  stage_obj_struct='quadratic',
                  stage_obj_pars=[],
-                 observation_target=[]):
+                 observation_target=[],
+                 is_warm_start=1,
+                 warm_start_pad='last',
+                 ctrl_nominal=[]):
         """
         Parameters
         ----------
@@ -882,6 +924,10 @@ class CtrlOptPred:
             The latter could be, for instance, the true model of the system.
             In turn, ``state_sys`` represents the (true) current state of the system and should be updated accordingly.
             Parameters ``sys_rhs, sys_out, state_sys`` are used in those controller modes which rely on them.
+        sys_rhs_batch : : function
+            Batched counterpart of ``sys_rhs``, see class documentation.
+        sys_rhs_jacs : : list of functions
+            Jacobians of ``sys_rhs`` with respect to state and action, see class documentation.
         prob_noise_pow : : number
             Power of probing noise during an initial phase to fill the estimator's buffer before applying optimal control.   
         is_est_model : : number
@@ -915,6 +961,10 @@ class CtrlOptPred:
             optimal infinite-horizon cost (a.k.a. the value function). The temporal errors are stacked up using the said buffer.
         critic_period : : number
             The same meaning as ``model_est_period``. 
+        critic_opt_method : : string
+            Method of the critic's optimizer, see class documentation.
+        critic_reg : : number
+            Regularization weight of the critic's least-squares problem, see class documentation.
         critic_struct : : natural number
             Choice of the structure of the critic's features.
             
@@ -953,6 +1003,12 @@ class CtrlOptPred:
                * - 'biquadratic'
                  - 4th order :math:`\\left( \\chi^\\top \\right)^2 R_2 \\left( \\chi \\right)^2 + \\chi^\\top R_1 \\chi`, where :math:`\\chi = [observation, action]`, ``stage_obj_pars``
                    should be ``[R1, R2]``
+        is_warm_start : : number
+            Flag to warm-start the actor's optimizer by the shifted previous optimal action sequence.
+        warm_start_pad : : string
+            Padding of the shifted action sequence: 'last' or 'nominal', see class documentation.
+        ctrl_nominal : : object
+            Nominal controller used for padding if ``warm_start_pad = 'nominal'``.
         """
         
         self.dim_input = dim_input
@@ -982,10 +1038,20 @@ class CtrlOptPred:
         self.action_buffer = np.zeros( [buffer_size, dim_input] )
         self.observation_buffer = np.zeros( [buffer_size, dim_output] )        
         
+        # Warm start of actor
+        self.is_warm_start = is_warm_start
+        self.warm_start_pad = warm_start_pad
+        self.ctrl_nominal = ctrl_nominal
+        self.action_sqn_prev = []
+        self.actor_opt_stats = {'runs': 0, 'nit': 0, 'nfev': 0, 'njev': 0, 'nit_last': 0}
+        self.stats = CtrlStats()
+        
         # Exogeneous model's things
         self.sys_rhs = sys_rhs
         self.sys_out = sys_out
         self.state_sys = state_sys
+        self.sys_rhs_batch = sys_rhs_batch
+        self.sys_rhs_jacs = sys_rhs_jacs
         
         # Model estimator's things
         self.is_est_model = is_est_model
@@ -1017,11 +1083,16 @@ class CtrlOptPred:
         self.Ncritic = np.min([self.Ncritic, self.buffer_size-1]) # Clip critic buffer size
         self.critic_period = critic_period
         self.critic_struct = critic_struct
+        self.critic_opt_method = critic_opt_method
+        self.critic_reg = critic_reg
         self.stage_obj_struct = stage_obj_struct
         self.stage_obj_pars = stage_obj_pars
         self.observation_target = observation_target
         
         self.accum_obj_val = 0
+        
+        # Discounting factors along the horizon
+        self.gamma_sqn = self.gamma**np.arange(self.Nactor)
 
         if self.critic_struct == 'quad-lin':
             self.dim_critic = int( ( ( self.dim_output + self.dim_input ) + 1 ) * ( self.dim_output + self.dim_input )/2 + (self.dim_output + self.dim_input) ) 
@@ -1040,6 +1111,8 @@ class CtrlOptPred:
             self.Wmin = -1e3*np.ones(self.dim_critic) 
             self.Wmax = 1e3*np.ones(self.dim_critic)
             
+        self.critic_features = FeatureMap(self.critic_struct, self.dim_output + self.dim_input, dim_mix=self.dim_input)
+            
         self.w_critic_prev = np.ones(self.dim_critic)  
         self.w_critic_init = self.w_critic_prev
         
@@ -1054,6 +1127,7 @@ class CtrlOptPred:
         """
         self.ctrl_clock = t0
         self.action_curr = self.action_min/10
+        self.action_sqn_prev = []
     
     def receive_sys_state(self, state):
         """
@@ -1084,6 +1158,52 @@ class CtrlOptPred:
             stage_obj = chi**2 @ R2 @ chi**2 + chi @ R1 @ chi
         
         return stage_obj
+    
+    def stage_obj_batch(self, observations, actions):
+        """
+        Vectorized :func:`~controllers.CtrlOptPred.stage_obj` over arrays of observations and actions of shapes ``[..., dim_output]``, resp., ``[..., dim_input]``.
+        Returns an array of stage objectives of shape ``[...]``.
+        
+        """
+        if len(self.observation_target) == 0:
+            chi = np.concatenate([observations, actions], axis=-1)
+        else:
+            chi = np.concatenate([observations - self.observation_target, actions], axis=-1)
+        
+        stage_objs = np.zeros(chi.shape[:-1])
+        
+        if self.stage_obj_struct == 'quadratic':
+            R1 = self.stage_obj_pars[0]
+            stage_objs = np.einsum('...i,ij,...j->...', chi, R1, chi)
+        elif self.stage_obj_struct == 'biquadratic':
+            R1 = self.stage_obj_pars[0]
+            R2 = self.stage_obj_pars[1]
+            stage_objs = np.einsum('...i,ij,...j->...', chi**2, R2, chi**2) + np.einsum('...i,ij,...j->...', chi, R1, chi)
+        
+        return stage_objs
+    
+    def _stage_obj_grad_batch(self, observations, actions):
+        """
+        Gradients of :func:`~controllers.CtrlOptPred.stage_obj` with respect to observation and action for arrays of observations and actions of shapes ``[L, dim_output]``, resp., ``[L, dim_input]``.
+        Returns arrays of shapes ``[L, dim_output]`` and ``[L, dim_input]``.
+        
+        """
+        if len(self.observation_target) == 0:
+            chi = np.concatenate([observations, actions], axis=1)
+        else:
+            chi = np.concatenate([observations - self.observation_target, actions], axis=1)
+        
+        grads = np.zeros(chi.shape)
+        
+        if self.stage_obj_struct == 'quadratic':
+            R1 = self.stage_obj_pars[0]
+            grads = chi @ (R1 + R1.T)
+        elif self.stage_obj_struct == 'biquadratic':
+            R1 = self.stage_obj_pars[0]
+            R2 = self.stage_obj_pars[1]
+            grads = 2 * chi * ( chi**2 @ (R2 + R2.T) ) + chi @ (R1 + R1.T)
+        
+        return grads[:, :self.dim_output], grads[:, self.dim_output:]
         
     def upd_accum_obj(self, observation, action):
         """
@@ -1199,21 +1319,29 @@ class CtrlOptPred:
 
         """
 
-        if self.observation_target == []:
-            chi = np.concatenate([observation, action])
+        return w_critic @ self._regressor_critic(observation, action)
+    
+    def _regressor_critic(self, observation, action):
+        """
+        Critic's features, so that the critic reads ``w_critic @ self._regressor_critic(observation, action)``.
+        Accepts batches of observations and actions of shapes ``[L, dim_output]``, resp., ``[L, dim_input]`` as well, in which case the result is of shape ``[L, dim_critic]``.
+
+        """
+        # In 'quad-mix', the features are of the observation itself
+        if len(self.observation_target) == 0 or self.critic_struct == 'quad-mix':
+            chi = np.concatenate([observation, action], axis=-1)
         else:
-            chi = np.concatenate([observation - self.observation_target, action])
-        
-        if self.critic_struct == 'quad-lin':
-            regressor_critic = np.concatenate([ uptria2vec( np.outer(chi, chi) ), chi ])
-        elif self.critic_struct == 'quadratic':
-            regressor_critic = np.concatenate([ uptria2vec( np.outer(chi, chi) ) ])   
-        elif self.critic_struct == 'quad-nomix':
-            regressor_critic = chi * chi
-        elif self.critic_struct == 'quad-mix':
-            regressor_critic = np.concatenate([ observation**2, np.kron(observation, action), action**2 ]) 
+            chi = np.concatenate([observation - self.observation_target, action], axis=-1)
 
-        return w_critic @ regressor_critic
+        return self.critic_features(chi)
+    
+    def _critic_batch(self, observations, actions, w_critic):
+        """
+        Critic over arrays of observations and actions of shapes ``[L, dim_output]``, resp., ``[L, dim_input]``.
+        Returns an array of shape ``[L, ]``.
+
+        """
+        return self._regressor_critic(observations, actions) @ w_critic
     
     def _critic_cost(self, w_critic):
         """
@@ -1250,12 +1378,38 @@ class CtrlOptPred:
     def _critic_optimizer(self):
         """
         This method is merely a wrapper for an optimizer that minimizes :func:`~controllers.CtrlOptPred._critic_cost`.
+        
+        Since the critic is linear in its weights, so are the temporal errors, and the critic's cost is minimized directly as a bounded linear least-squares problem
+        
+        .. math::
+            \\min_{w_{min} \\le w \\le w_{max}} \\frac 1 2 \\| \\Phi w - b \\|^2 + \\frac{\\epsilon}{2} \\| w - w_{init} \\|^2,
+        
+        where the rows of :math:`\\Phi` are the critic's features at the previous observations and actions in the buffer and :math:`b` stacks the respective stage objectives plus the discounted critic values at the next observations and actions.
+        The regularization weight :math:`\\epsilon` is ``critic_reg``.
+        If ``critic_opt_method`` is not 'lsq', ``scipy.optimize.minimize`` is used instead.
 
         """        
         
+        if self.critic_opt_method == 'lsq':
+            observations_prev = self.observation_buffer[:self.Ncritic-1, :]
+            observations_next = self.observation_buffer[1:self.Ncritic, :]
+            actions_prev = self.action_buffer[:self.Ncritic-1, :]
+            actions_next = self.action_buffer[1:self.Ncritic, :]
+            
+            Phi = self._regressor_critic(observations_prev, actions_prev)
+            b = self.gamma * self._critic_batch(observations_next, actions_next, self.w_critic_prev) + self.stage_obj_batch(observations_prev, actions_prev)
+            
+            if self.critic_reg > 0:
+                Phi = np.vstack([Phi, np.sqrt(self.critic_reg) * np.eye(self.dim_critic)])
+                b = np.concatenate([b, np.sqrt(self.critic_reg) * self.w_critic_init])
+            
+            w_critic = sp.optimize.lsq_linear(Phi, b, bounds=(self.Wmin, self.Wmax), method='bvls').x
+            
+            return w_critic
+        
         # Optimization method of critic    
         # Methods that respect constraints: BFGS, L-BFGS-B, SLSQP, trust-constr, Powell
-        critic_opt_method = 'SLSQP'
+        critic_opt_method = self.critic_opt_method
         if critic_opt_method == 'trust-constr':
             critic_opt_options = {'maxiter': 200, 'disp': False} #'disp': True, 'verbose': 2}
         else:
@@ -1272,8 +1426,47 @@ class CtrlOptPred:
         
         return w_critic
     
-    def _actor_cost(self, action_sqn, observation):
+    def _predict_batch(self, action_sqns, observation):
         """
+        Predict observations along the horizon for a batch of action sequences of shape ``[B, Nactor, dim_input]``.
+        Returns an array of shape ``[B, Nactor, dim_output]`` whose first observation in each sequence is the current one.
+        
+        With an exogenously passed model, the prediction is done by the Euler scheme with step ``pred_step_size``, vectorized over the batch if ``sys_rhs_batch`` is passed.
+
+        """
+        B = action_sqns.shape[0]
+        
+        observation_sqns = np.zeros([B, self.Nactor, self.dim_output])
+        
+        if not self.is_est_model:    # Via exogenously passed model
+            observation_sqns[:, 0, :] = observation
+            
+            if self.sys_rhs_batch:
+                states = np.tile(self.state_sys, (B, 1))
+                for k in range(1, self.Nactor):
+                    states = states + self.pred_step_size * self.sys_rhs_batch([], states, action_sqns[:, k-1, :])  # Euler scheme
+                    
+                    observation_sqns[:, k, :] = self.sys_out(states)
+            else:
+                for b in range(B):
+                    state = self.state_sys
+                    for k in range(1, self.Nactor):
+                        state = state + self.pred_step_size * self.sys_rhs([], state, action_sqns[b, k-1, :])  # Euler scheme
+                        
+                        observation_sqns[b, k, :] = self.sys_out(state)
+                
+        elif self.is_est_model:    # Via estimated model
+            upsampling = int(self.pred_step_size/self.sampling_time)
+            for b in range(B):
+                my_action_sqn_upsampled = action_sqns[b].repeat(upsampling, axis=0)
+                observation_sqn_upsampled, _ = dss_sim(self.my_model.A, self.my_model.B, self.my_model.C, self.my_model.D, my_action_sqn_upsampled, self.my_model.x0est, observation)
+                observation_sqns[b] = observation_sqn_upsampled[::upsampling]
+            
+        return observation_sqns
+    
+    def _actor_cost_batch(self, action_sqns, observation):
+        """
+        Actor cost for a batch of flattened action sequences of shape ``[B, Nactor*dim_input]``. Returns an array of shape ``[B, ]``.
         See class documentation.
         
         Customization
@@ -1282,53 +1475,127 @@ class CtrlOptPred:
         Introduce your mode and the respective actor loss in this method. Don't forget to provide description in the class documentation.
 
         """
+        B = action_sqns.shape[0]
         
-        my_action_sqn = np.reshape(action_sqn, [self.Nactor, self.dim_input])
+        my_action_sqns = np.reshape(action_sqns, [B, self.Nactor, self.dim_input])
         
-        observation_sqn = np.zeros([self.Nactor, self.dim_output])
-        
-        # System output prediction
-        if not self.is_est_model:    # Via exogenously passed model
-            observation_sqn[0, :] = observation
-            state = self.state_sys
-            for k in range(1, self.Nactor):
-                # state = get_next_state(state, my_action_sqn[k-1, :], delta)         TODO
-                state = state + self.pred_step_size * self.sys_rhs([], state, my_action_sqn[k-1, :])  # Euler scheme
-                
-                observation_sqn[k, :] = self.sys_out(state)
-
-        elif self.is_est_model:    # Via estimated model
-            my_action_sqn_upsampled = my_action_sqn.repeat(int(self.pred_step_size/self.sampling_time), axis=0)
-            observation_sqn_upsampled, _ = dss_sim(self.my_model.A, self.my_model.B, self.my_model.C, self.my_model.D, my_action_sqn_upsampled, self.my_model.x0est, observation)
-            observation_sqn = observation_sqn_upsampled[::int(self.pred_step_size/self.sampling_time)]
+        observation_sqns = self._predict_batch(my_action_sqns, observation)
         
-        J = 0         
+        J = np.zeros(B)
         if self.mode=='MPC':
-            for k in range(self.Nactor):
-                J += self.gamma**k * self.stage_obj(observation_sqn[k, :], my_action_sqn[k, :])
+            J = self.stage_obj_batch(observation_sqns, my_action_sqns) @ self.gamma_sqn
         elif self.mode=='RQL':     # RL: Q-learning with Ncritic-1 roll-outs of stage objectives
-             for k in range(self.Nactor-1):
-                J += self.gamma**k * self.stage_obj(observation_sqn[k, :], my_action_sqn[k, :])
-             J += self._critic(observation_sqn[-1, :], my_action_sqn[-1, :], self.w_critic)
+            J = self.stage_obj_batch(observation_sqns[:, :-1, :], my_action_sqns[:, :-1, :]) @ self.gamma_sqn[:-1]
+            J += self._critic_batch(observation_sqns[:, -1, :], my_action_sqns[:, -1, :], self.w_critic)
         elif self.mode=='SQL':     # RL: stacked Q-learning
-             for k in range(self.Nactor): 
-                Q = self._critic(observation_sqn[k, :], my_action_sqn[k, :], self.w_critic)
-                
-                # With state constraints via indicator function
-                # Q = w_critic @ self._regressor_critic( observation_sqn[k, :], my_action_sqn[k, :] ) + state_constraint_indicator(observation_sqn[k, 0])
-                
-                # DEBUG ===================================================================
-                # =========================================================================
-                # R  = '\033[31m'
-                # Bl  = '\033[30m'
-                # if state_constraint_indicator(observation_sqn[k, 0]) > 1:
-                #     print(R+str(state_constraint_indicator(observation_sqn[k, 0]))+Bl)
-                # /DEBUG ==================================================================                 
-                
-                J += Q 
-
+            Q = self._critic_batch(np.reshape(observation_sqns, [B*self.Nactor, self.dim_output]),
+                                   np.reshape(my_action_sqns, [B*self.Nactor, self.dim_input]),
+                                   self.w_critic)
+            J = np.sum(np.reshape(Q, [B, self.Nactor]), axis=1)
+            
         return J
     
+    def _actor_cost(self, action_sqn, observation):
+        """
+        See class documentation and :func:`~controllers.CtrlOptPred._actor_cost_batch`.
+
+        """
+        return self._actor_cost_batch(np.reshape(action_sqn, [1, -1]), observation)[0]
+    
+    def _actor_cost_grad(self, action_sqn, observation):
+        """
+        Gradient of :func:`~controllers.CtrlOptPred._actor_cost` with respect to the flattened action sequence.
+        
+        In the mode 'MPC' with the quadratic or biquadratic stage objective and an exogenously passed model with Jacobians ``sys_rhs_jacs``, the gradient is exact, see :func:`~controllers.CtrlOptPred._actor_cost_grad_adjoint`.
+        Otherwise, it is estimated by :func:`~controllers.CtrlOptPred._actor_cost_grad_fd`.
+
+        """
+        if self.sys_rhs_jacs and not self.is_est_model and self.mode == 'MPC' and self.stage_obj_struct in ['quadratic', 'biquadratic']:
+            return self._actor_cost_grad_adjoint(action_sqn, observation)
+        else:
+            return self._actor_cost_grad_fd(action_sqn, observation)
+    
+    def _actor_cost_grad_fd(self, action_sqn, observation):
+        """
+        Gradient of :func:`~controllers.CtrlOptPred._actor_cost` by forward finite differences, where all perturbed action sequences are evaluated in one call of :func:`~controllers.CtrlOptPred._actor_cost_batch`.
+        Near the upper control bounds, backward differences are used instead.
+
+        """
+        dim = action_sqn.size
+        
+        steps = np.sqrt(np.finfo(float).eps) * np.maximum(1, np.abs(action_sqn))
+        steps = np.where(action_sqn + steps > self.action_sqn_max, -steps, steps)
+        
+        action_sqns = np.tile(action_sqn, (dim + 1, 1))
+        action_sqns[np.arange(1, dim + 1), np.arange(dim)] += steps
+        
+        J = self._actor_cost_batch(action_sqns, observation)
+        
+        return (J[1:] - J[0]) / steps
+    
+    def _actor_cost_grad_adjoint(self, action_sqn, observation):
+        """
+        Exact gradient of :func:`~controllers.CtrlOptPred._actor_cost` in the mode 'MPC' by a reverse (adjoint) pass over the Euler rollout
+        
+        .. math::
+            \\begin{array}{ll}
+                \\lambda_{N_a} & = \\gamma^{N_a-1} \\nabla_y \\rho_{N_a}, \\newline
+                \\lambda_k & = \\gamma^{k-1} \\nabla_y \\rho_k + \\left( I + \\delta \\partial_x f_k \\right)^\\top \\lambda_{k+1}, \\newline
+                \\nabla_{u_k} J_a & = \\gamma^{k-1} \\nabla_u \\rho_k + \\delta \\left( \\partial_u f_k \\right)^\\top \\lambda_{k+1},
+            \\end{array}
+        
+        where :math:`\\delta` is the prediction step size and :math:`f_k` is ``sys_rhs`` at the :math:`k`-th predicted state and action.
+        Costs one forward rollout and one backward pass, instead of ``Nactor*dim_input+1`` rollouts of finite differences.
+        Assumes that the observation equals the state.
+
+        """
+        my_action_sqn = np.reshape(action_sqn, [self.Nactor, self.dim_input])
+        
+        state_sqn = np.zeros([self.Nactor, self.dim_output])
+        state_sqn[0, :] = self.state_sys
+        
+        for k in range(1, self.Nactor):
+            state_sqn[k, :] = state_sqn[k-1, :] + self.pred_step_size * self.sys_rhs([], state_sqn[k-1, :], my_action_sqn[k-1, :])  # Euler scheme
+        
+        observation_sqn = state_sqn.copy()
+        observation_sqn[0, :] = observation
+        
+        grad_observation_sqn, grad_action_sqn = self._stage_obj_grad_batch(observation_sqn, my_action_sqn)
+        
+        grad = self.gamma_sqn[:, np.newaxis] * grad_action_sqn
+        
+        # Adjoint state
+        lmbd = self.gamma_sqn[-1] * grad_observation_sqn[-1, :]
+        
+        for k in range(self.Nactor-2, -1, -1):
+            jac_state = self.sys_rhs_jacs[0]([], state_sqn[k, :], my_action_sqn[k, :])
+            jac_action = self.sys_rhs_jacs[1]([], state_sqn[k, :], my_action_sqn[k, :])
+            
+            grad[k, :] += self.pred_step_size * jac_action.T @ lmbd
+            
+            lmbd = self.gamma_sqn[k] * grad_observation_sqn[k, :] + lmbd + self.pred_step_size * jac_state.T @ lmbd
+        
+        return np.reshape(grad, [self.Nactor*self.dim_input,])
+    
+    def _actor_init(self, observation):
+        """
+        Initial guess for the actor's optimizer. With warm start, this is the previous optimal action sequence shifted by one step and padded according to ``warm_start_pad``.
+        
+        """
+        if not self.is_warm_start or len(self.action_sqn_prev) == 0:
+            return np.reshape(self.action_sqn_init, [self.Nactor*self.dim_input,])
+        
+        my_action_sqn_prev = np.reshape(self.action_sqn_prev, [self.Nactor, self.dim_input])
+        
+        my_action_sqn_init = np.vstack([my_action_sqn_prev[1:, :], my_action_sqn_prev[-1, :]])
+        
+        if self.warm_start_pad == 'nominal' and self.ctrl_nominal:
+            observation_sqn = self._predict_batch(my_action_sqn_init[np.newaxis, :, :], observation)
+            action_nominal = self.ctrl_nominal.compute_action_vanila(observation_sqn[0, -1, :])
+            my_action_sqn_init[-1, :] = np.clip(action_nominal, self.action_min, self.action_max)
+        
+        return np.reshape(my_action_sqn_init, [self.Nactor*self.dim_input,])
+    
     def _actor_optimizer(self, observation):
         """
         This method is merely a wrapper for an optimizer that minimizes :func:`~controllers.CtrlOptPred._actor_cost`.
@@ -1380,28 +1647,43 @@ class CtrlOptPred:
        
         isGlobOpt = 0
         
-        my_action_sqn_init = np.reshape(self.action_sqn_init, [self.Nactor*self.dim_input,])
+        my_action_sqn_init = self._actor_init(observation)
         
         bnds = sp.optimize.Bounds(self.action_sqn_min, self.action_sqn_max, keep_feasible=True)
         
         try:
             if isGlobOpt:
-                minimizer_kwargs = {'method': actor_opt_method, 'bounds': bnds, 'tol': 1e-7, 'options': actor_opt_options}
-                action_sqn = basinhopping(lambda action_sqn: self._actor_cost(action_sqn, observation),
-                                          my_action_sqn_init,
-                                          minimizer_kwargs=minimizer_kwargs,
-                                          niter = 10).x
+                minimizer_kwargs = {'method': actor_opt_method, 'jac': lambda action_sqn: self._actor_cost_grad(action_sqn, observation), 'bounds': bnds, 'tol': 1e-7, 'options': actor_opt_options}
+                actor_opt_result = basinhopping(lambda action_sqn: self._actor_cost(action_sqn, observation),
+                                                my_action_sqn_init,
+                                                minimizer_kwargs=minimizer_kwargs,
+                                                niter = 10)
             else:
-                action_sqn = minimize(lambda action_sqn: self._actor_cost(action_sqn, observation),
-                                      my_action_sqn_init,
-                                      method=actor_opt_method,
-                                      tol=1e-7,
-                                      bounds=bnds,
-                                      options=actor_opt_options).x        
+                actor_opt_result = minimize(lambda action_sqn: self._actor_cost(action_sqn, observation),
+                                            my_action_sqn_init,
+                                            method=actor_opt_method,
+                                            jac=lambda action_sqn: self._actor_cost_grad(action_sqn, observation),
+                                            tol=1e-7,
+                                            bounds=bnds,
+                                            options=actor_opt_options)
+            
+            action_sqn = actor_opt_result.x
+            self.action_sqn_prev = action_sqn
+            
+            self.actor_opt_stats['runs'] += 1
+            self.actor_opt_stats['nit_last'] = actor_opt_result.get('nit', 0)
+            for key in ['nit', 'nfev', 'njev']:
+                self.actor_opt_stats[key] += actor_opt_result.get(key, 0)
+            
+            self.opt_info = (actor_opt_result.get('nit', np.nan), actor_opt_result.get('nfev', np.nan),
+                             0 if actor_opt_result.get('success', True) else 2, actor_opt_result.fun)
 
         except ValueError:
             print('Actor''s optimizer failed. Returning default action')
             action_sqn = my_action_sqn_init
+            self.action_sqn_prev = []
+            
+            self.opt_info = (np.nan, np.nan, 1, np.nan)
         
         # DEBUG ===================================================================
         # ================================Interm output of model prediction quality
@@ -1442,6 +1724,8 @@ class CtrlOptPred:
         time_in_sample = t - self.ctrl_clock
         
         if time_in_sample >= self.sampling_time: # New sample
+            tic = time.perf_counter()
+            
             # Update controller's internal clock
             self.ctrl_clock = t
             
@@ -1489,6 +1773,9 @@ class CtrlOptPred:
             
             self.action_curr = action
             
+            if not (self.is_prob_noise and self.is_est_model):
+                self.stats.record(time.perf_counter() - tic, *self.opt_info)
+            
             return action    
     
         else:
@@ -1513,6 +1800,19 @@ class CtrlNominal3WRobot:
         Initial value of the controller's internal clock.
     sampling_time : : number
         Controller's sampling time (in seconds).       
+    theta_opt_method : : string
+        Method of minimization of the marginal function over :math:`\\theta`, see :func:`~controllers.CtrlNominal3WRobot._minimizer_theta`:
+            
+        | ``brent`` : search over a grid of ``theta_grid_size`` points in :math:`[-\\pi, \\pi]` and the previous minimizer, refined by bounded Brent's method (fast)
+        | ``trust-constr`` : ``scipy.optimize.minimize`` with the method 'trust-constr' started at zero
+        
+    theta_grid_size : : natural number
+        Size of the grid of the method ``brent``.
+    theta_memo_size : : natural number
+        Maximal number of minimizers to memoize. Minimizers are memoized by ``(xNI, eta)``, so that, e.g., :func:`~controllers.CtrlNominal3WRobot.compute_LF` at the current observation does not repeat the minimization.
+        If the memo is full, the least recently used minimizer is evicted. If 0, minimizers are not memoized.
+    stats : : :class:`~utilities.CtrlStats`
+        Per-sample wall time of the action computation.
     
     References
     ----------
@@ -1526,7 +1826,7 @@ class CtrlNominal3WRobot:
     
     """
     
-    def __init__(self, m, I, ctrl_gain=10, ctrl_bnds=[], t0=0, sampling_time=0.1):
+    def __init__(self, m, I, ctrl_gain=10, ctrl_bnds=[], t0=0, sampling_time=0.1, theta_opt_method='brent', theta_grid_size=256, theta_memo_size=1000):
         self.m = m
         self.I = I
         self.ctrl_gain = ctrl_gain
@@ -1535,6 +1835,15 @@ class CtrlNominal3WRobot:
         self.sampling_time = sampling_time
         
         self.action_curr = np.zeros(2)
+        
+        self.stats = CtrlStats()
+        
+        self.theta_opt_method = theta_opt_method
+        self.theta_grid = np.linspace(-np.pi, np.pi, theta_grid_size)
+        self.theta_refine_max = 3
+        self.theta_memo_size = theta_memo_size
+        self.theta_memo = OrderedDict()
+        self.theta_prev = []
    
     def reset(self, t0):
         """
@@ -1543,6 +1852,7 @@ class CtrlNominal3WRobot:
         """
         self.ctrl_clock = t0
         self.action_curr = np.zeros(2)   
+        self.theta_prev = []
     
     def _zeta(self, xNI, theta):
         """
@@ -1617,14 +1927,101 @@ class CtrlNominal3WRobot:
         
         return F + 1/2 * np.dot(z, z)
     
+    def _Fc_batch(self, xNI, eta, thetas):
+        """
+        Vectorized :func:`~controllers.CtrlNominal3WRobot._Fc` over an array ``thetas`` of shape ``[K, ]``. Returns an array of shape ``[K, ]``.
+
+        """
+        cos_theta = np.cos(thetas)
+        sin_theta = np.sin(thetas)
+        
+        sigma_tilde = xNI[0]*cos_theta + xNI[1]*sin_theta + np.sqrt(np.abs(xNI[2]))
+        
+        F = xNI[0]**4 + xNI[1]**4 + np.abs( xNI[2] )**3 / sigma_tilde**2
+        
+        # Subgradients as in _zeta, one row per theta
+        zeta_vals = np.zeros([thetas.size, 3])
+        zeta_vals[:, 0] = 4*xNI[0]**3 - 2 * np.abs(xNI[2])**3 * cos_theta/sigma_tilde**3
+        zeta_vals[:, 1] = 4*xNI[1]**3 - 2 * np.abs(xNI[2])**3 * sin_theta/sigma_tilde**3
+        zeta_vals[:, 2] = ( 3*xNI[0]*cos_theta + 3*xNI[1]*sin_theta + 2*np.sqrt(np.abs(xNI[2])) ) * xNI[2]**2 * np.sign(xNI[2]) / sigma_tilde**3
+        
+        G = np.array([[1,      0],
+                      [0,      1],
+                      [xNI[1], -xNI[0]]])
+        
+        kappa_vals = - np.cbrt( zeta_vals @ G )
+        
+        z = eta - kappa_vals
+        
+        return F + 1/2 * np.sum(z * z, axis=1)
+    
     def _minimizer_theta(self, xNI, eta):
-        thetaInit = 0
+        """
+        Minimizer of :func:`~controllers.CtrlNominal3WRobot._Fc` over :math:`\\theta \\in [-\\pi, \\pi]`, memoized by ``(xNI, eta)``.
         
-        bnds = sp.optimize.Bounds(-np.pi, np.pi, keep_feasible=False)
+        With ``theta_opt_method = 'brent'``, the marginal function is evaluated on a grid together with the previous minimizer,
+        and the best local minima on the grid (at most ``theta_refine_max``) as well as the previous minimizer, if it is the best point, are refined by bounded Brent's method
+        within one grid step.
+
+        """
+        key = (xNI.tobytes(), eta.tobytes())
         
-        options = {'maxiter': 50, 'disp': False}
+        if key in self.theta_memo:
+            self.theta_memo.move_to_end(key)
+            return self.theta_memo[key]
+        
+        if self.theta_opt_method == 'trust-constr':
+            thetaInit = 0
+            
+            bnds = sp.optimize.Bounds(-np.pi, np.pi, keep_feasible=False)
+            
+            options = {'maxiter': 50, 'disp': False}
+            
+            theta_val = minimize(lambda theta: self._Fc(xNI, eta, theta[0]), thetaInit, method='trust-constr', tol=1e-6, bounds=bnds, options=options).x[0]
+        else:
+            thetas = self.theta_grid
+            if len(self.theta_prev) > 0:
+                thetas = np.append(thetas, self.theta_prev)
+            
+            Fc_vals = self._Fc_batch(xNI, eta, thetas)
+            
+            if np.all(np.isnan(Fc_vals)):
+                theta_val = 0.0
+            else:
+                Fc_vals = np.where(np.isnan(Fc_vals), np.inf, Fc_vals)
+                
+                k_best = np.argmin(Fc_vals)
+                theta_val = thetas[k_best]
+                Fc_best = Fc_vals[k_best]
+                
+                # The marginal function is nonsmooth and may have narrow dips, hence each of the best local minima on the grid is refined
+                Fc_grid = Fc_vals[:self.theta_grid.size]
+                is_local_min = (Fc_grid <= np.roll(Fc_grid, 1)) & (Fc_grid <= np.roll(Fc_grid, -1))
+                candidates = np.flatnonzero(is_local_min)
+                candidates = candidates[np.argsort(Fc_grid[candidates])][:self.theta_refine_max]
+                
+                if k_best >= self.theta_grid.size:
+                    candidates = np.append(candidates, k_best)
+                
+                grid_step = self.theta_grid[1] - self.theta_grid[0]
+                
+                for k in candidates:
+                    result = sp.optimize.minimize_scalar(lambda theta: self._Fc_batch(xNI, eta, np.array([theta]))[0],
+                                                         bounds=(max(thetas[k] - grid_step, -np.pi), min(thetas[k] + grid_step, np.pi)),
+                                                         method='bounded',
+                                                         options={'xatol': 1e-6})
+                    
+                    if result.fun < Fc_best:
+                        theta_val = result.x
+                        Fc_best = result.fun
+            
+            self.theta_prev = [theta_val]
         
-        theta_val = minimize(lambda theta: self._Fc(xNI, eta, theta), thetaInit, method='trust-constr', tol=1e-6, bounds=bnds, options=options).x
+        if self.theta_memo_size > 0:
+            if len(self.theta_memo) >= self.theta_memo_size:
+                self.theta_memo.popitem(last=False)
+            
+            self.theta_memo[key] = theta_val
         
         return theta_val
         
@@ -1700,6 +2097,8 @@ class CtrlNominal3WRobot:
         time_in_sample = t - self.ctrl_clock
         
         if time_in_sample >= self.sampling_time: # New sample
+            tic = time.perf_counter()
+            
             # Update internal clock
             self.ctrl_clock = t
             
@@ -1716,6 +2115,8 @@ class CtrlNominal3WRobot:
                     action[k] = np.clip(action[k], self.ctrl_bnds[k, 0], self.ctrl_bnds[k, 1])           
             
             self.action_curr = action
+            
+            self.stats.record(time.perf_counter() - tic)
 
             # DEBUG ===================================================================   
             # ================================LF debugger
@@ -1761,6 +2162,11 @@ class CtrlNominal3WRobotNI:
     """
     Nominal parking controller for NI using disassembled subgradients.
     
+    Besides single observations, the controller can be applied to a fleet of ``B`` robots at once via :func:`~controllers.CtrlNominal3WRobotNI.compute_action_batch`,
+    where each robot has its own sampling clock ``ctrl_clocks``.
+    
+    Per-sample wall times of the action computation of :func:`~controllers.CtrlNominal3WRobotNI.compute_action` are recorded into ``stats``, see :class:`~utilities.CtrlStats`.
+    
     """
     
     def __init__(self, ctrl_gain=10, ctrl_bnds=[], t0=0, sampling_time=0.1):
@@ -1770,6 +2176,12 @@ class CtrlNominal3WRobotNI:
         self.sampling_time = sampling_time
         
         self.action_curr = np.zeros(2)
+        
+        self.stats = CtrlStats()
+        
+        # Fleet's clocks and actions
+        self.ctrl_clocks = []
+        self.actions_curr = []
    
     def reset(self, t0):
         """
@@ -1778,6 +2190,8 @@ class CtrlNominal3WRobotNI:
         """
         self.ctrl_clock = t0
         self.action_curr = np.zeros(2)   
+        self.ctrl_clocks = []
+        self.actions_curr = []
     
     def _zeta(self, xNI):
         """
@@ -1904,6 +2318,8 @@ class CtrlNominal3WRobotNI:
         time_in_sample = t - self.ctrl_clock
         
         if time_in_sample >= self.sampling_time: # New sample
+            tic = time.perf_counter()
+            
             # Update internal clock
             self.ctrl_clock = t
             
@@ -1918,6 +2334,8 @@ class CtrlNominal3WRobotNI:
             
             self.action_curr = action
             
+            self.stats.record(time.perf_counter() - tic)
+            
             # DEBUG ===================================================================   
             # ================================LF debugger
             # R  = '\033[31m'
@@ -1957,6 +2375,126 @@ class CtrlNominal3WRobotNI:
         
         return xNI[0]**4 + xNI[1]**4 + np.abs( xNI[2] )**3 / sigma**2
     
+    def _Cart2NH_batch(self, coords_Cart):
+        """
+        Vectorized :func:`~controllers.CtrlNominal3WRobotNI._Cart2NH` over an array ``coords_Cart`` of shape ``[B, 3]``. Returns an array of shape ``[B, 3]``.
+
+        """
+        xc = coords_Cart[:, 0]
+        yc = coords_Cart[:, 1]
+        alpha = coords_Cart[:, 2]
+        
+        cos_alpha = np.cos(alpha)
+        sin_alpha = np.sin(alpha)
+        
+        xNI = np.empty([coords_Cart.shape[0], 3])
+        
+        xNI[:, 0] = alpha
+        xNI[:, 1] = xc * cos_alpha + yc * sin_alpha
+        xNI[:, 2] = - 2 * ( yc * cos_alpha - xc * sin_alpha ) - alpha * xNI[:, 1]
+        
+        return xNI
+    
+    def _zeta_batch(self, xNI):
+        """
+        Vectorized :func:`~controllers.CtrlNominal3WRobotNI._zeta` over an array ``xNI`` of shape ``[B, 3]``. Returns an array of shape ``[B, 3]``.
+
+        """
+        x1, x2, x3 = xNI[:, 0], xNI[:, 1], xNI[:, 2]
+        
+        abs_x3 = np.abs(x3)
+        
+        # Singular terms only occur in the branch that is not selected
+        with np.errstate(divide='ignore', invalid='ignore'):
+            norm_x12 = np.sqrt( x1**2 + x2**2 )
+            
+            sigma = norm_x12 + np.sqrt(abs_x3)
+            
+            nablaL = np.empty(xNI.shape)
+            nablaL[:, 0] = 4*x1**3 + abs_x3**3/sigma**3 * 1/norm_x12**3 * 2 * x1
+            nablaL[:, 1] = 4*x2**3 + abs_x3**3/sigma**3 * 1/norm_x12**3 * 2 * x2
+            nablaL[:, 2] = 3 * abs_x3**2 * np.sign(x3) + abs_x3**3 / sigma**3 * 1/np.sqrt(abs_x3) * np.sign(x3)
+            
+            # Subgradient of the marginal function at theta = 0
+            sigma_tilde = x1 + np.sqrt(abs_x3)
+            
+            nablaF = np.empty(xNI.shape)
+            nablaF[:, 0] = 4*x1**3 - 2 * abs_x3**3 / sigma_tilde**3
+            nablaF[:, 1] = 4*x2**3
+            nablaF[:, 2] = ( 3*x1 + 2*np.sqrt(abs_x3) ) * x3**2 * np.sign(x3) / sigma_tilde**3
+        
+        is_origin_x12 = (x1 == 0) & (x2 == 0)
+        
+        return np.where(is_origin_x12[:, np.newaxis], nablaF, nablaL)
+    
+    def _kappa_batch(self, xNI):
+        """
+        Vectorized :func:`~controllers.CtrlNominal3WRobotNI._kappa` over an array ``xNI`` of shape ``[B, 3]``. Returns an array of shape ``[B, 2]``.
+
+        """
+        zeta_vals = self._zeta_batch(xNI)
+        
+        # Products of the subgradients with the columns of G = [[1, 0], [0, 1], [x2, -x1]]
+        zeta_G = np.empty([xNI.shape[0], 2])
+        zeta_G[:, 0] = zeta_vals[:, 0] + zeta_vals[:, 2] * xNI[:, 1]
+        zeta_G[:, 1] = zeta_vals[:, 1] - zeta_vals[:, 2] * xNI[:, 0]
+        
+        return - np.cbrt(zeta_G)
+    
+    def _NH2ctrl_Cart_batch(self, xNI, uNI):
+        """
+        Vectorized :func:`~controllers.CtrlNominal3WRobotNI._NH2ctrl_Cart` over arrays ``xNI``, ``uNI`` of shapes ``[B, 3]``, resp., ``[B, 2]``. Returns an array of shape ``[B, 2]``.
+
+        """
+        uCart = np.empty([xNI.shape[0], 2])
+        
+        uCart[:, 0] = uNI[:, 1] + 1/2 * uNI[:, 0] * ( xNI[:, 2] + xNI[:, 0] * xNI[:, 1] )
+        uCart[:, 1] = uNI[:, 0]
+        
+        return uCart
+    
+    def compute_action_vanila_batch(self, observations):
+        """
+        Same as :func:`~CtrlNominal3WRobotNI.compute_action_vanila`, but for an array of observations of shape ``[B, 3]``. Returns actions of shape ``[B, 2]``.
+
+        """
+        xNI = self._Cart2NH_batch( observations )
+        kappa_vals = self._kappa_batch(xNI)
+        uNI = self.ctrl_gain * kappa_vals
+        actions = self._NH2ctrl_Cart_batch(xNI, uNI)
+        
+        return actions
+    
+    def compute_action_batch(self, t, observations):
+        """
+        Compute sampled actions of a fleet of robots with observations of shape ``[B, 3]``. Returns actions of shape ``[B, 2]``, clipped to ``ctrl_bnds`` as in :func:`~CtrlNominal3WRobotNI.compute_action`.
+        
+        Each robot has its own sampling clock: only the actions of the robots, whose sampling time has elapsed, are updated.
+        The time ``t`` is either common or an array of shape ``[B, ]``.
+        Clocks are initialized with the controller's clock on the first call, or if the fleet size changes.
+        
+        """
+        B = observations.shape[0]
+        
+        if len(self.ctrl_clocks) != B:
+            self.ctrl_clocks = np.full(B, float(self.ctrl_clock))
+            self.actions_curr = np.zeros([B, 2])
+        
+        t = np.broadcast_to(t, (B,))
+        
+        is_new_sample = t - self.ctrl_clocks >= self.sampling_time
+        
+        if is_new_sample.any():
+            self.ctrl_clocks[is_new_sample] = t[is_new_sample]
+            actions = self.compute_action_vanila_batch(observations[is_new_sample])
+            
+            if len(self.ctrl_bnds) > 0 and self.ctrl_bnds.any():
+                actions = np.clip(actions, self.ctrl_bnds[:, 0], self.ctrl_bnds[:, 1])
+            
+            self.actions_curr[is_new_sample] = actions
+        
+        return self.actions_curr.copy()
+    
     
 ####Kinematic Controller Class
 # === Custom Kinematic Controller ===
@@ -1972,37 +2510,79 @@ class CtrlKinematic:
         self.ctrl_clock = t0
         self.sampling_time = sampling_time
         self.action_curr = np.zeros(2)
+        
+        self.stats = CtrlStats()
+        
+        # Fleet's clocks and actions, see compute_action_batch
+        self.ctrl_clocks = []
+        self.actions_curr = []
 
     def reset(self, t0):
         self.ctrl_clock = t0
         self.action_curr = np.zeros(2)
+        self.ctrl_clocks = []
+        self.actions_curr = []
 
-    def compute_action(self, t, observation):
-        time_in_sample = t - self.ctrl_clock
-        if time_in_sample >= self.sampling_time:
-            self.ctrl_clock = t
+    def _ctrl_law(self, x, y, theta, x_ref, y_ref, theta_ref):
+        # Works element-wise, i.e., for single robots as well as for arrays of robots
+        dx = x_ref - x
+        dy = y_ref - y
 
-            x, y, theta, x_ref, y_ref, theta_ref = observation
+        rho = np.sqrt(dx**2 + dy**2)
+        alpha = np.arctan2(dy, dx) - theta
+        beta = theta_ref - theta - alpha
 
-            dx = x_ref - x
-            dy = y_ref - y
+        alpha = (alpha + np.pi) % (2 * np.pi) - np.pi
+        beta = (beta + np.pi) % (2 * np.pi) - np.pi
 
-            rho = np.sqrt(dx**2 + dy**2)
-            alpha = np.arctan2(dy, dx) - theta
-            beta = theta_ref - theta - alpha
+        v = self.k_rho * rho
+        omega = self.k_alpha * alpha + self.k_beta * beta
 
-            alpha = (alpha + np.pi) % (2 * np.pi) - np.pi
-            beta = (beta + np.pi) % (2 * np.pi) - np.pi
+        v = np.clip(v, self.ctrl_bnds[0, 0], self.ctrl_bnds[0, 1])
+        omega = np.clip(omega, self.ctrl_bnds[1, 0], self.ctrl_bnds[1, 1])
+        
+        return v, omega
 
-            v = self.k_rho * rho
-            omega = self.k_alpha * alpha + self.k_beta * beta
+    def compute_action(self, t, observation):
+        time_in_sample = t - self.ctrl_clock
+        if time_in_sample >= self.sampling_time:
+            tic = time.perf_counter()
+            
+            self.ctrl_clock = t
 
-            v = np.clip(v, self.ctrl_bnds[0, 0], self.ctrl_bnds[0, 1])
-            omega = np.clip(omega, self.ctrl_bnds[1, 0], self.ctrl_bnds[1, 1])
+            v, omega = self._ctrl_law(*observation)
 
             self.action_curr = np.array([v, omega])
+            
+            self.stats.record(time.perf_counter() - tic)
 
         return self.action_curr
+    
+    def compute_action_batch(self, t, observations):
+        """
+        Sampled actions of a fleet of robots with observations ``[x, y, theta, x_ref, y_ref, theta_ref]`` stacked into an array of shape ``[B, 6]``.
+        Returns actions of shape ``[B, 2]``.
+        
+        Each robot has its own sampling clock, the time ``t`` is either common or an array of shape ``[B, ]``, see :func:`~controllers.CtrlNominal3WRobotNI.compute_action_batch`.
+        
+        """
+        B = observations.shape[0]
+        
+        if len(self.ctrl_clocks) != B:
+            self.ctrl_clocks = np.full(B, float(self.ctrl_clock))
+            self.actions_curr = np.zeros([B, 2])
+        
+        t = np.broadcast_to(t, (B,))
+        
+        is_new_sample = t - self.ctrl_clocks >= self.sampling_time
+        
+        if is_new_sample.any():
+            self.ctrl_clocks[is_new_sample] = t[is_new_sample]
+            v, omega = self._ctrl_law(*observations[is_new_sample].T)
+            self.actions_curr[is_new_sample, 0] = v
+            self.actions_curr[is_new_sample, 1] = omega
+        
+        return self.actions_curr.copy()
 
 
     #LQR Controller Class
@@ -2012,57 +2592,396 @@ import numpy as np
 from scipy.linalg import solve_discrete_are
 
 class CtrlLQR:
-    def __init__(self, A, B, Q, R, sampling_time=0.1):  # ✅ fixed here
+    """
+    LQR for a kinematic 3-wheel robot with state error feedback.
+
+    Modes:
+
+    | fixed gain : one DARE solution for the model ``(A, B)``, see :func:`~controllers.CtrlLQR.compute_action`
+    | gain-scheduled : DARE gains precomputed on a grid of ``sched_headings`` headings, uniform over :math:`[-\\pi, \\pi)`, and the uniform grid ``sched_speeds`` of speeds.
+      The gain is bilinearly interpolated in a heading, see ``sched_point``, and a speed (clamped to the grid) in constant time per step.
+      Enabled by passing ``state`` to :func:`~controllers.CtrlLQR.compute_action`
+    | TV-LQR : finite-horizon gains of a backward Riccati sweep along a reference trajectory, see :func:`~controllers.CtrlLQR.set_reference`
+      and :func:`~controllers.CtrlLQR.compute_action_tracking`
+
+    Attributes
+    ----------
+    A, B : : arrays of shape ``[dim_state, dim_state]``, resp., ``[dim_state, dim_input]``
+        Discrete-time model for the fixed gain. May be ``None`` if only the other modes are used.
+    Q, R : : arrays
+        State and action weights.
+    sys_linearize : : function
+        Discrete-time linearization called as ``sys_linearize(state, action, sampling_time)`` that returns ``(A, B)``,
+        e.g., ``my_sys.linearize_discr``, see :func:`~systems.System.linearize_discr`. Required for the gain-scheduled and TV-LQR modes.
+    sched_headings : : natural number
+        Number of grid headings of the gain table. If 0, no table is built.
+    sched_speeds : : array of shape ``[n_speeds, ]``
+        Uniform grid of nonzero speeds of the gain table (the model at zero speed is not stabilizable).
+    sched_point : : string
+        Heading the gain is scheduled on:
+            
+        | ``state`` : the robot's heading, so that the gain follows the robot as it turns away from the reference heading (default)
+        | ``reference`` : the reference heading, i.e., the one the state error is taken from.
+          For a fixed goal, this is a single gain, namely, that of the model at the goal heading
+        
+    stats : : :class:`~utilities.CtrlStats`
+        Wall time of each call and, for the fixed gain, LQR cost-to-go :math:`e^\\top P e` of the state error.
+
+    """
+
+    def __init__(self, A, B, Q, R, sampling_time=0.1, sys_linearize=[], sched_headings=0, sched_speeds=[], sched_point='state'):  # ✅ fixed here
         self.A = A
         self.B = B
         self.Q = Q
         self.R = R
         self.sampling_time = sampling_time
+        self.sys_linearize = sys_linearize
 
-        # Solve Discrete-time Algebraic Riccati Equation (DARE)
-        self.P = solve_discrete_are(A, B, Q, R)
-
-        # Compute optimal LQR gain
-        self.K = np.linalg.inv(B.T @ self.P @ B + R) @ (B.T @ self.P @ A)
+        if A is not None:
+            # Solve Discrete-time Algebraic Riccati Equation (DARE) and compute optimal LQR gain
+            self.K, self.P = self._dare_gain(A, B)
 
         # Add control bounds
         self.ctrl_bnds = np.array([[0.0, 1.0], [-1.0, 1.0]])
 
-    def compute_action(self, state_error):
-        u = -self.K @ state_error
+        self.action_curr = np.zeros(2)
 
-        # Apply control bounds
+        if sched_point not in ['state', 'reference']:
+            raise ValueError('Unknown scheduling point of CtrlLQR: ' + str(sched_point))
+
+        self.sched_point = sched_point
+
+        # Gain table over headings and speeds
+        self.gain_table = []
+        self.speed_sched = 0.0
+        if sched_headings > 0:
+            self._build_gain_table(sched_headings, np.asarray(sched_speeds, dtype=float))
+
+        # Reference trajectory and gains of TV-LQR
+        self.states_ref = []
+        self.actions_ref = []
+        self.K_sqn = []
+        self.t_ref = 0
+
+        self.stats = CtrlStats()
+
+    def reset(self, t0):
+        self.action_curr = np.zeros(2)
+
+        if len(self.gain_table) > 0:
+            self.speed_sched = self.sched_speeds[-1]
+
+    def _dare_gain(self, A, B):
+        P = solve_discrete_are(A, B, self.Q, self.R)
+        K = np.linalg.solve(B.T @ P @ B + self.R, B.T @ P @ A)
+
+        return K, P
+
+    def _build_gain_table(self, sched_headings, sched_speeds):
+        """
+        DARE gains at the operating points ``state = [0, 0, theta]``, ``action = [v, 0]`` for all grid headings ``theta`` and speeds ``v``.
+
+        """
+        if not self.sys_linearize:
+            raise ValueError('Gain scheduling of CtrlLQR needs sys_linearize')
+
+        if sched_speeds.size > 1 and not np.allclose(np.diff(sched_speeds), sched_speeds[1] - sched_speeds[0]):
+            raise ValueError('Speeds of the gain table of CtrlLQR must form a uniform grid')
+
+        self.sched_thetas = -np.pi + 2 * np.pi / sched_headings * np.arange(sched_headings)
+        self.sched_speeds = sched_speeds
+
+        self.gain_table = np.zeros([sched_headings, sched_speeds.size, self.R.shape[0], self.Q.shape[0]])
+
+        for i, theta in enumerate(self.sched_thetas):
+            for j, v in enumerate(sched_speeds):
+                A, B = self.sys_linearize(np.array([0.0, 0.0, theta]), np.array([v, 0.0]), self.sampling_time)
+                self.gain_table[i, j], _ = self._dare_gain(A, B)
+
+        # Until an action is applied, the gain is scheduled on the top speed
+        self.speed_sched = sched_speeds[-1]
+
+    def gain_scheduled(self, theta, v):
+        """
+        Gain interpolated from the table at the heading ``theta`` and speed ``v``: periodically in the heading, and clamped to the grid in the speed.
+
+        """
+        n_thetas, n_speeds = self.gain_table.shape[:2]
+
+        pos_theta = (theta + np.pi) / (2 * np.pi) * n_thetas
+        i = int(np.floor(pos_theta))
+        w_theta = pos_theta - i
+        i0, i1 = i % n_thetas, (i + 1) % n_thetas
+
+        if n_speeds > 1:
+            pos_v = np.clip((v - self.sched_speeds[0]) / (self.sched_speeds[1] - self.sched_speeds[0]), 0, n_speeds - 1)
+            j0 = min(int(pos_v), n_speeds - 2)
+            w_v = pos_v - j0
+        else:
+            j0, w_v = 0, 0.0
+        j1 = min(j0 + 1, n_speeds - 1)
+
+        return ( (1 - w_theta) * ( (1 - w_v) * self.gain_table[i0, j0] + w_v * self.gain_table[i0, j1] )
+                 + w_theta * ( (1 - w_v) * self.gain_table[i1, j0] + w_v * self.gain_table[i1, j1] ) )
+
+    def _clip_action(self, u):
         v = np.clip(u[0], self.ctrl_bnds[0, 0], self.ctrl_bnds[0, 1])
         omega = np.clip(u[1], self.ctrl_bnds[1, 0], self.ctrl_bnds[1, 1])
-        return np.array([v, omega])
+
+        self.action_curr = np.array([v, omega])
+
+        return self.action_curr
+
+    def compute_action(self, state_error, state=None, speed_ref=None):
+        """
+        Action :math:`-K e` for the state error ``state_error``.
+        If ``state`` is passed and a gain table is built, the gain is scheduled on the heading given by ``sched_point``, i.e., ``state[2]`` or ``state[2] - state_error[2]``,
+        and on the reference speed ``speed_ref``, if passed, or else on the last applied speed, which starts at the top grid speed. Otherwise, the fixed gain is used.
+
+        """
+        tic = time.perf_counter()
+
+        if state is not None and len(self.gain_table) > 0:
+            theta = state[2] if self.sched_point == 'state' else state[2] - state_error[2]
+            speed = self.speed_sched if speed_ref is None else speed_ref
+
+            u = -self.gain_scheduled(theta, speed) @ state_error
+            cost = np.nan
+        else:
+            u = -self.K @ state_error
+            cost = state_error @ self.P @ state_error
+
+        # Apply control bounds
+        action = self._clip_action(u)
+
+        if len(self.gain_table) > 0:
+            self.speed_sched = action[0]
+
+        self.stats.record(time.perf_counter() - tic, cost=cost)
+
+        return action
+
+    def set_reference(self, states_ref, actions_ref, t0=0, Qf=None):
+        """
+        Finite-horizon TV-LQR along the reference states ``states_ref`` of shape ``[N+1, dim_state]`` under the reference actions ``actions_ref`` of shape ``[N, dim_input]``,
+        sampled with ``sampling_time`` from the time ``t0``.
+
+        The dynamics are linearized at each reference point by ``sys_linearize``, and the gains are computed by the backward Riccati sweep
+        :math:`P_N = Q_f`, :math:`K_k = (R + B_k^\\top P_{k+1} B_k)^{-1} B_k^\\top P_{k+1} A_k`, :math:`P_k = Q + A_k^\\top P_{k+1} (A_k - B_k K_k)`.
+        The terminal weight ``Qf`` defaults to ``Q``.
+
+        """
+        if not self.sys_linearize:
+            raise ValueError('TV-LQR of CtrlLQR needs sys_linearize')
+
+        self.states_ref = np.asarray(states_ref, dtype=float)
+        self.actions_ref = np.asarray(actions_ref, dtype=float)
+        self.t_ref = t0
+
+        N = self.actions_ref.shape[0]
+
+        self.K_sqn = np.zeros([N, self.R.shape[0], self.Q.shape[0]])
+
+        P = self.Q if Qf is None else Qf
+
+        for k in reversed(range(N)):
+            A, B = self.sys_linearize(self.states_ref[k], self.actions_ref[k], self.sampling_time)
+
+            self.K_sqn[k] = np.linalg.solve(self.R + B.T @ P @ B, B.T @ P @ A)
+            P = self.Q + A.T @ P @ (A - B @ self.K_sqn[k])
+
+            # Symmetrize against round-off
+            P = (P + P.T) / 2
+
+    def compute_action_tracking(self, t, state):
+        """
+        TV-LQR action :math:`u^{ref}_k - K_k (state - state^{ref}_k)` at the reference sample ``k`` nearest to the time ``t``, see :func:`~controllers.CtrlLQR.set_reference`.
+        After the end of the reference, its last sample is tracked with the last gain. The heading error is wrapped into :math:`[-\\pi, \\pi)`.
+
+        """
+        tic = time.perf_counter()
+
+        k = int(np.clip(np.round((t - self.t_ref) / self.sampling_time), 0, self.K_sqn.shape[0] - 1))
+
+        state_error = state - self.states_ref[k]
+        state_error[2] = (state_error[2] + np.pi) % (2 * np.pi) - np.pi
+
+        action = self._clip_action(self.actions_ref[k] - self.K_sqn[k] @ state_error)
+
+        self.stats.record(time.perf_counter() - tic)
+
+        return action
 
 ##MPC Controller
+import os
+import hashlib
 import numpy as np
+import casadi
 from casadi import SX, vertcat, Function, nlpsol
 
 class CtrlMPC:
-    def __init__(self, N=20, Q=None, R=None, Qf=None, sampling_time=0.1):
+    """
+    MPC for a kinematic 3-wheel robot via CasADi and IPOPT.
+    
+    The NLP is parametric: the weights ``Q``, ``R``, ``Qf`` enter it as parameters along with the current and reference states,
+    and the control bounds are imposed as bounds on the decision variables. Hence, the solver depends only on the horizon and sampling time,
+    and one solver is shared by all controllers with these in the process (e.g., a sweep over weights).
+    
+    The terminal constraint :math:`x_N = x_{ref}` is kept in the NLP, but enforced only if ``is_terminal_constraint`` is set, via its constraint bounds.
+    Under the control bounds, it is infeasible for short horizons, so by default the terminal state is only penalized by ``Qf``.
+    
+    Building the solver for long horizons is expensive. If ``cache_dir`` is passed, the solver is serialized into this directory on the first build
+    and loaded from there by all subsequent controllers with the same horizon and sampling time, also in other processes.
+    
+    If ``is_warm_start`` is set, the solver is started at each sample from the previous primal solution and multipliers shifted by one stage.
+    Iteration counts accumulated over samples are kept in ``opt_stats``. Per-sample wall time, iterations, solver status and cost are recorded into ``stats``,
+    see :class:`~utilities.CtrlStats`.
+    
+    Solver types (``solver_type``):
+        
+    .. list-table:: Solver types
+       :widths: 10 90
+       :header-rows: 1
+    
+       * - Type
+         - Description
+       * - 'ipopt'
+         - Interior point method, solves each sample to convergence. ``time_budget`` (in seconds) is passed to IPOPT as the maximal wall time,
+           after which its current iterate is used
+       * - 'rti'
+         - Real-time iteration: at most ``rti_max_iter`` SQP iterations (CasADi's ``sqpmethod`` with the QP solver ``qrqp``) from the shifted previous solution.
+           The QP of each iteration is solved with at most ``rti_qp_max_iter`` active-set iterations, so that the time of an SQP iteration is bounded.
+           If ``time_budget`` is given, counted from the call of :func:`~controllers.CtrlMPC.compute_action`, no iteration is started that may overrun it,
+           and the best iterate is used: the cheapest one within the feasibility tolerance ``rti_feas_tol``, or, if none, the least infeasible one.
+           The worst-case time of an iteration is predicted by the longest of the last ``10`` ones, with the time of processing the solution after the iterations reserved likewise.
+           If not even one iteration fits, the shifted previous solution is applied.
+           Each such sample forgets the oldest iteration time, so that a single slow iteration does not keep the controller from iterating.
+           Without a warm start, i.e., at the first sample, one iteration is always done
+    
+    Actions are printed to the console as single lines at most once per ``print_period`` seconds of wall-clock time, see :class:`~loggers.ConsoleReporter`.
+    
+    """
+    
+    # Version of the NLP formulation. Included in the cache key, so that cached solvers of an outdated formulation are not used
+    nlp_version = 3
+    
+    # Solvers built or loaded in this process, keyed by :meth:`_solver_key`
+    _solver_memo = {}
+    
+    def __init__(self, N=20, Q=None, R=None, Qf=None, sampling_time=0.1, cache_dir=None, is_warm_start=1, is_terminal_constraint=0,
+                 solver_type='ipopt', rti_max_iter=1, rti_feas_tol=1e-6, rti_qp_max_iter=10, time_budget=None, print_period=1.0):
         self.N = N
         self.Q = Q if Q is not None else np.diag([5, 5, 0.1])
         self.R = R if R is not None else np.diag([0.1, 0.1])
         self.Qf = Qf if Qf is not None else np.diag([10, 10, 0.5])
         self.Ts = sampling_time
+        self.cache_dir = cache_dir
+        self.is_warm_start = is_warm_start
+        self.is_terminal_constraint = is_terminal_constraint
+        self.solver_type = solver_type
+        self.rti_max_iter = rti_max_iter
+        self.rti_feas_tol = rti_feas_tol
+        self.rti_qp_max_iter = rti_qp_max_iter
+        self.time_budget = time_budget
+        
+        if self.solver_type not in ['ipopt', 'rti']:
+            raise ValueError('Unknown MPC solver type: ' + str(self.solver_type))
 
         self.ctrl_bnds = np.array([[0.0, 1.0], [-1.0, 1.0]])  # v ∈ [0,1], ω ∈ [-1,1]
 
-        self._build_optimizer()
-
         self.nx = 3
         self.nu = 2
-        self.nlp_g = self.g.shape[0]
 
-    def _build_optimizer(self):
-        nx = 3
-        nu = 2
+        self._build_optimizer()
+
+        self.nlp_g = self.solver.size1_in('lbg')
+        
+        # Weights as passed in the parameter vector after the current and reference states
+        self.p_weights = np.concatenate([np.ravel(self.Q, order='F'), np.ravel(self.R, order='F'), np.ravel(self.Qf, order='F')])
+        
+        # Control bounds on the stages of U, states are unbounded
+        self.lbx = np.concatenate([np.tile(self.ctrl_bnds[:, 0], self.N), -np.inf * np.ones(self.nx * (self.N + 1))])
+        self.ubx = np.concatenate([np.tile(self.ctrl_bnds[:, 1], self.N), np.inf * np.ones(self.nx * (self.N + 1))])
+        
+        # Initial state and dynamics are equalities, the terminal constraint is released if not enforced
+        self.lbg = np.zeros(self.nlp_g)
+        self.ubg = np.zeros(self.nlp_g)
+        if not self.is_terminal_constraint:
+            self.lbg[-self.nx:] = -np.inf
+            self.ubg[-self.nx:] = np.inf
+        
+        self.sol_prev = None
+        
+        # Recent RTI iteration times and times of processing the solution. Kept over episodes
+        self.times_iter = []
+        self.times_post = []
+        
+        self.opt_stats = {'runs': 0, 'nit': 0, 'nit_last': 0, 'time_last': 0.0}
+        self.stats = CtrlStats()
+        
+        self.reporter = ConsoleReporter(['t [s]', 'v [m/s]', 'omega [rad/s]'], ('8.2f', '8.2f', '8.2f'), print_period=print_period)
 
+    def reset(self, t0):
+        """
+        Resets controller for use in multi-episode simulation: the warm start is dropped.
+        
+        """
+        self.sol_prev = None
+        self.reporter.reset()
+
+    def _shift_sol(self, x):
+        """
+        Shift the previous solution by one stage to initialize IPOPT at the current sample.
+        The last stage is repeated, the initial state of the primal guess is set to the current state ``x``.
+        
+        Variables are ordered as ``[U, X]`` with stages stacked, constraints as ``[initial state, N dynamics, terminal state]`` with ``nx`` rows each.
+        The multiplier of the dynamics at stage :math:`k+1` is taken for stage :math:`k`.
+        
+        """
+        nU = self.nu * self.N
+        
+        def shift(vec, dim_stage):
+            stages = vec.reshape(-1, dim_stage)
+            return np.vstack([stages[1:], stages[-1:]]).reshape(-1, 1)
+        
+        opt_vars = self.sol_prev['x']
+        opt_vars_init = np.vstack([shift(opt_vars[:nU], self.nu), shift(opt_vars[nU:], self.nx)])
+        opt_vars_init[nU:nU + self.nx, 0] = x
+        
+        lam_x_init = np.vstack([shift(self.sol_prev['lam_x'][:nU], self.nu), shift(self.sol_prev['lam_x'][nU:], self.nx)])
+        
+        lam_g = self.sol_prev['lam_g'].reshape(-1, self.nx)
+        lam_g_init = np.vstack([lam_g[1:self.N + 1], lam_g[self.N:self.N + 1], lam_g[self.N + 1:]]).reshape(-1, 1)
+        
+        return opt_vars_init, lam_x_init, lam_g_init
+
+    def _solver_key(self):
+        """
+        Everything the solver depends on.
+        
+        """
+        # The time budget is built into IPOPT, whereas RTI handles it per call
+        time_budget = self.time_budget if self.solver_type == 'ipopt' else None
+        qp_max_iter = self.rti_qp_max_iter if self.solver_type == 'rti' else None
+        
+        return (self.nlp_version, casadi.__version__, self.N, float(self.Ts), bool(self.is_warm_start), self.solver_type, time_budget, qp_max_iter)
+
+    def _cache_file(self):
+        """
+        Path of the cached solver, named by a hash of :meth:`_solver_key`.
+        
+        """
+        key = hashlib.sha1(repr(self._solver_key()).encode())
+        
+        return os.path.join(self.cache_dir, 'mpc_solver_' + key.hexdigest() + '.casadi')
+
+    def _build_optimizer(self):
+        nx = self.nx
+        nu = self.nu
+        
+        # Discrete-time model. Cheap to build, so it is set also when the solver comes from the memo or the disk cache
         x = SX.sym("x", nx)
         u = SX.sym("u", nu)
-
         theta = x[2]
         x_next = vertcat(
             x[0] + self.Ts * u[0] * np.cos(theta),
@@ -2071,13 +2990,33 @@ class CtrlMPC:
         )
 
         self.f = Function("f", [x, u], [x_next])
+        
+        if self._solver_key() in self._solver_memo:
+            self.solver = self._solver_memo[self._solver_key()]
+            return
+        
+        if self.cache_dir is not None and os.path.exists(self._cache_file()):
+            try:
+                self.solver = Function.load(self._cache_file())
+                self._solver_memo[self._solver_key()] = self.solver
+                return
+            except Exception as e:
+                warnings.warn('Loading cached MPC solver failed, rebuilding it: ' + str(e))
 
         X = SX.sym("X", nx, self.N + 1)
         U = SX.sym("U", nu, self.N)
-        P = SX.sym("P", nx * 2)
+        P = SX.sym("P", nx * 2 + nx * nx + nu * nu + nx * nx)
 
         x0 = P[:nx]
-        x_ref = P[nx:]
+        x_ref = P[nx:2 * nx]
+        
+        # Weights, stacked column-wise
+        idx = 2 * nx
+        Q = P[idx:idx + nx * nx].reshape((nx, nx))
+        idx += nx * nx
+        R = P[idx:idx + nu * nu].reshape((nu, nu))
+        idx += nu * nu
+        Qf = P[idx:idx + nx * nx].reshape((nx, nx))
 
         cost = 0
         g = [X[:, 0] - x0]
@@ -2085,51 +3024,180 @@ class CtrlMPC:
         for k in range(self.N):
             xk = X[:, k]
             uk = U[:, k]
-            cost += (xk - x_ref).T @ self.Q @ (xk - x_ref) + uk.T @ self.R @ uk
+            cost += (xk - x_ref).T @ Q @ (xk - x_ref) + uk.T @ R @ uk
             g.append(X[:, k + 1] - self.f(xk, uk))
 
-        cost += (X[:, self.N] - x_ref).T @ self.Qf @ (X[:, self.N] - x_ref)
+        cost += (X[:, self.N] - x_ref).T @ Qf @ (X[:, self.N] - x_ref)
         g.append(X[:, self.N] - x_ref)
 
         OPT_variables = vertcat(U.reshape((-1, 1)), X.reshape((-1, 1)))
         g = vertcat(*g)
         nlp = {"f": cost, "x": OPT_variables, "g": g, "p": P}
 
-        opts = {
-            "ipopt.print_level": 0,
-            "print_time": False,
-            "ipopt.max_iter": 100,
-            "ipopt.tol": 1e-4
-        }
+        if self.solver_type == 'rti':
+            # One SQP iteration per call, the iterations of a sample are driven by compute_action
+            opts = {
+                "qpsol": "qrqp",
+                "qpsol_options": {"print_iter": False, "print_header": False, "error_on_fail": False, "max_iter": int(self.rti_qp_max_iter)},
+                "max_iter": 1,
+                "convexify_strategy": "regularize",
+                "print_header": False,
+                "print_iteration": False,
+                "print_status": False,
+                "print_time": False,
+                "error_on_fail": False
+            }
+            
+            self.solver = nlpsol("solver", "sqpmethod", nlp, opts)
+        
+        else:
+            opts = {
+                "ipopt.print_level": 0,
+                "print_time": False,
+                "ipopt.max_iter": 100,
+                "ipopt.tol": 1e-4
+            }
+            
+            if self.is_warm_start:
+                # Start from the passed primal-dual guess with a small barrier, instead of pushing it into the interior
+                opts.update({
+                    "ipopt.warm_start_init_point": "yes",
+                    "ipopt.warm_start_bound_push": 1e-6,
+                    "ipopt.warm_start_mult_bound_push": 1e-6,
+                    "ipopt.mu_init": 1e-3
+                })
+            
+            if self.time_budget is not None:
+                opts["ipopt.max_wall_time"] = float(self.time_budget)
+    
+            self.solver = nlpsol("solver", "ipopt", nlp, opts)
+        self._solver_memo[self._solver_key()] = self.solver
+        
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            
+            # Write to a temporary file first, so that concurrent processes never load a partially written solver
+            cache_file_tmp = self._cache_file() + '.' + str(os.getpid()) + '.tmp'
+            self.solver.save(cache_file_tmp)
+            os.replace(cache_file_tmp, self._cache_file())
 
-        self.solver = nlpsol("solver", "ipopt", nlp, opts)
-        self.g = g
+    def _solve_rti(self, opt_vars_init, lam_x_init, lam_g_init, p, tic, is_warm):
+        """
+        Anytime SQP: up to ``rti_max_iter`` iterations within ``time_budget`` from the time ``tic`` or until convergence, returns the best iterate and the number of iterations.
+        If the initial guess is a warm start (``is_warm``) and not even one iteration fits into the budget, the initial guess is returned with zero iterations.
+        
+        """
+        sol_best = None
+        nit = 0
+        
+        time_post = max(self.times_post) if self.times_post else 0.0
+        
+        for k in range(self.rti_max_iter):
+            time_iter = max(self.times_iter) if self.times_iter else 0.0
+            
+            # Do not start an iteration that may overrun the budget. Without a warm start, the first one is always done
+            if (k > 0 or is_warm) and self.time_budget is not None and time.perf_counter() - tic + time_iter + time_post > self.time_budget:
+                if k == 0:
+                    self.times_iter = self.times_iter[1:]
+                break
+            
+            tic_iter = time.perf_counter()
+            
+            sol = self.solver(x0=opt_vars_init, lam_x0=lam_x_init, lam_g0=lam_g_init, p=p,
+                              lbx=self.lbx, ubx=self.ubx, lbg=self.lbg, ubg=self.ubg)
+            
+            nit += 1
+            
+            g = sol['g'].full().flatten()
+            infeas = np.max(np.maximum(self.lbg - g, g - self.ubg))
+            cost = float(sol['f'])
+            
+            if sol_best is None:
+                is_better = True
+            elif infeas <= self.rti_feas_tol:
+                is_better = infeas_best > self.rti_feas_tol or cost < cost_best
+            else:
+                is_better = infeas_best > self.rti_feas_tol and infeas < infeas_best
+            
+            if is_better:
+                sol_best, infeas_best, cost_best = sol, infeas, cost
+            
+            self.times_iter = self.times_iter[-9:] + [time.perf_counter() - tic_iter]
+            
+            # Converged to the tolerances of the SQP method
+            if self.solver.stats()['success']:
+                break
+            
+            opt_vars_init, lam_x_init, lam_g_init = sol['x'], sol['lam_x'], sol['lam_g']
+        
+        if sol_best is None:
+            sol_best = {'x': casadi.DM(opt_vars_init), 'lam_x': casadi.DM(lam_x_init), 'lam_g': casadi.DM(lam_g_init), 'f': casadi.DM(np.nan)}
+        
+        return sol_best, nit
 
     def compute_action(self, t, observation):
+        tic = time.perf_counter()
+        
         x = observation[:self.nx]
         x_ref = observation[self.nx:]
-        p = np.concatenate([x, x_ref])
+        p = np.concatenate([x, x_ref, self.p_weights])
 
-        u0 = 0.5 * np.ones((self.nu * self.N, 1))
-        x0 = np.tile(x.reshape(-1, 1), (1, self.N + 1)).reshape((-1, 1))
+        is_warm = self.is_warm_start and self.sol_prev is not None
+        
+        if is_warm:
+            opt_vars_init, lam_x_init, lam_g_init = self._shift_sol(x)
+        else:
+            u0 = 0.5 * np.ones((self.nu * self.N, 1))
+            x0 = np.tile(x.reshape(-1, 1), (1, self.N + 1)).reshape((-1, 1))
+            opt_vars_init = np.vstack([u0, x0])
+            lam_x_init = np.zeros_like(opt_vars_init)
+            lam_g_init = np.zeros((self.nlp_g, 1))
 
         try:
-            sol = self.solver(
-                x0=np.vstack([u0, x0]),
-                p=p,
-                lbg=np.zeros(self.nlp_g),
-                ubg=np.zeros(self.nlp_g),
-            )
+            if self.solver_type == 'rti':
+                sol, nit = self._solve_rti(opt_vars_init, lam_x_init, lam_g_init, p, tic, is_warm)
+                tic_post = time.perf_counter()
+            else:
+                sol = self.solver(
+                    x0=opt_vars_init,
+                    lam_x0=lam_x_init,
+                    lam_g0=lam_g_init,
+                    p=p,
+                    lbx=self.lbx,
+                    ubx=self.ubx,
+                    lbg=self.lbg,
+                    ubg=self.ubg,
+                )
+                nit = self.solver.stats()['iter_count']
+            
+            # RTI is meant to stop before convergence, so only failures of IPOPT are flagged
+            is_converged = self.solver_type == 'rti' or self.solver.stats()['success']
+            
             u_opt = sol["x"][: self.nu].full().flatten()
+            
+            self.sol_prev = {key: sol[key].full() for key in ['x', 'lam_x', 'lam_g']}
+            
+            self.opt_stats['runs'] += 1
+            self.opt_stats['nit_last'] = nit
+            self.opt_stats['nit'] += nit
+            if self.solver_type == 'rti':
+                self.times_post = self.times_post[-9:] + [time.perf_counter() - tic_post]
+            
+            self.opt_stats['time_last'] = time.perf_counter() - tic
+            
+            self.stats.record(self.opt_stats['time_last'], nit=nit, status=0 if is_converged else 2, cost=float(sol['f']))
 
         except Exception as e:
             print(f"⚠️ MPC solver failed at t={t:.2f}s: {e}")
+            self.sol_prev = None
+            self.stats.record(time.perf_counter() - tic, status=1)
             return np.array([0.0, 0.0])
 
+        # Bounds are imposed in the NLP, clipping only removes the bound relaxation of IPOPT
         v = np.clip(u_opt[0], self.ctrl_bnds[0, 0], self.ctrl_bnds[0, 1])
         omega = np.clip(u_opt[1], self.ctrl_bnds[1, 0], self.ctrl_bnds[1, 1])
 
-        print(f"t={t:.2f}s → v={v:.2f}, omega={omega:.2f}")
+        self.reporter.report([t, v, omega])
         return np.array([v, omega])
 
 
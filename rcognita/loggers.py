@@ -14,6 +14,291 @@ Remarks:
 from tabulate import tabulate
 
 import csv
+import json
+import os
+import time
+import numpy as np
+
+class BufferedCSVWriter:
+    """
+    Persistent session for writing numeric data rows into a CSV file.
+    
+    The file is kept open and rows are accumulated in a preallocated array, which is written out in chunks:
+    when ``chunk_size`` rows are collected or ``flush_period`` seconds have passed since the last write-out, whichever comes first.
+    Call :func:`~loggers.BufferedCSVWriter.close` when done, or use the writer as a context manager.
+    
+    Attributes
+    ----------
+    datafile : : string
+        Path to the data file. Rows are appended to it.
+    chunk_size : : natural number
+        Number of rows per write-out.
+    flush_period : : number
+        Maximal time (in seconds) rows are held in the buffer.
+    
+    """
+    def __init__(self, datafile, chunk_size=1000, flush_period=5.0):
+        self.datafile = datafile
+        self.chunk_size = chunk_size
+        self.flush_period = flush_period
+        
+        self.outfile = open(datafile, 'a', newline='')
+        self.writer = csv.writer(self.outfile)
+        
+        # Allocated at the first row, when the row length is known
+        self.buffer = None
+        self.row_count = 0
+        self.flush_time = time.monotonic()
+        
+    def write_row(self, row):
+        if self.buffer is None:
+            self.buffer = np.zeros([self.chunk_size, len(row)])
+        
+        self.buffer[self.row_count, :] = row
+        self.row_count += 1
+        
+        if self.row_count >= self.chunk_size or time.monotonic() - self.flush_time >= self.flush_period:
+            self.flush()
+            
+    def flush(self):
+        """
+        Write out the buffered rows.
+        
+        """
+        if self.row_count > 0:
+            self.writer.writerows(self.buffer[:self.row_count].tolist())
+            self.outfile.flush()
+            self.row_count = 0
+        
+        self.flush_time = time.monotonic()
+        
+    def close(self):
+        if not self.outfile.closed:
+            self.flush()
+            self.outfile.close()
+            
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class TrajectoryStore:
+    """
+    Persistent session for writing data rows into a binary columnar trajectory file.
+    
+    The file is a standard ``.npy`` file holding a 1D structured array with one ``float64`` field per column, so that it can be read back memory-mapped, without copying or parsing, see :func:`~loggers.load_trajectory`.
+    Rows are buffered in a preallocated array and appended to the file in chunks, after which the array header is updated in place.
+    The header is padded to a fixed size for this purpose.
+    If the file exists, rows are appended to it, provided that the columns match.
+    Call :func:`~loggers.TrajectoryStore.close` when done, or use the store as a context manager.
+    
+    Attributes
+    ----------
+    datafile : : string
+        Path to the data file.
+    columns : : list of strings
+        Field names of the structured array.
+    chunk_size : : natural number
+        Number of rows per write-out.
+    flush_period : : number
+        Maximal time (in seconds) rows are held in the buffer.
+    
+    """
+    
+    # Header size (in bytes) including the magic string. Must be a multiple of 64
+    header_size = 512
+    
+    def __init__(self, datafile, columns, chunk_size=1000, flush_period=5.0):
+        self.datafile = datafile
+        self.dtype = np.dtype([(column, np.float64) for column in columns])
+        self.chunk_size = chunk_size
+        self.flush_period = flush_period
+        
+        if os.path.exists(datafile) and os.path.getsize(datafile) > 0:
+            self.outfile = open(datafile, 'r+b')
+            if np.lib.format.read_magic(self.outfile) != (1, 0):
+                raise ValueError('Trajectory file ' + datafile + ' has an unsupported format')
+            shape, _, dtype = np.lib.format.read_array_header_1_0(self.outfile)
+            if dtype != self.dtype or self.outfile.tell() != self.header_size:
+                raise ValueError('Trajectory file ' + datafile + ' does not match the logged columns')
+            self.row_total = shape[0]
+        else:
+            self.outfile = open(datafile, 'w+b')
+            self.row_total = 0
+            self._write_header()
+        
+        self.outfile.seek(self.header_size + self.row_total * self.dtype.itemsize)
+        
+        self.buffer = np.zeros([chunk_size, len(columns)])
+        self.row_count = 0
+        self.flush_time = time.monotonic()
+        
+    def _write_header(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(self.dtype), self.row_total)
+        
+        # Magic string, version 1.0, header length, header padded with spaces and terminated by a newline
+        header_len = self.header_size - 10
+        if len(header) + 1 > header_len:
+            raise ValueError('Too many columns for a trajectory file')
+        
+        self.outfile.seek(0)
+        self.outfile.write(np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + header_len.to_bytes(2, 'little'))
+        self.outfile.write((header.ljust(header_len - 1) + '\n').encode('latin1'))
+        
+    def write_row(self, row):
+        self.buffer[self.row_count, :] = row
+        self.row_count += 1
+        
+        if self.row_count >= self.chunk_size or time.monotonic() - self.flush_time >= self.flush_period:
+            self.flush()
+            
+    def flush(self):
+        """
+        Append the buffered rows and update the header.
+        
+        """
+        if self.row_count > 0:
+            self.outfile.write(self.buffer[:self.row_count].tobytes())
+            self.row_total += self.row_count
+            self.row_count = 0
+            
+            self._write_header()
+            self.outfile.seek(0, os.SEEK_END)
+            self.outfile.flush()
+        
+        self.flush_time = time.monotonic()
+        
+    def close(self):
+        if not self.outfile.closed:
+            self.flush()
+            self.outfile.close()
+            
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class ConsoleReporter:
+    """
+    Throttled console output of simulation steps.
+    
+    A row is printed every ``print_every`` steps, but not more often than once per ``print_period`` seconds of wall-clock time.
+    Rows are rendered as single lines by a format string precomputed from the column titles and formats, with the header repeated every ``header_every`` printed rows.
+    Each printed line is accompanied by rolling aggregates over the steps since the previous printed line: the simulation rate (steps per second of wall-clock time) and the averages of the columns in ``avg_columns``.
+    If ``is_table`` is ``True``, rows are rendered as grid tables by ``tabulate`` instead (this is slow), without aggregates.
+    
+    Attributes
+    ----------
+    row_header : : list of strings
+        Column titles.
+    row_format : : tuple of strings
+        Float formats of the columns, e.g., ``'8.3f'``.
+    print_every : : natural number
+        Print every ``print_every``-th step.
+    print_period : : number
+        Minimal wall-clock time (in seconds) between printed rows.
+    header_every : : natural number
+        Number of printed rows between repetitions of the header.
+    avg_columns : : list of strings
+        Titles of the columns to be averaged over the steps between printed rows.
+    is_table : : number
+        Flag to render rows by ``tabulate``.
+    
+    """
+    
+    def __init__(self, row_header, row_format, print_every=1, print_period=0.0, header_every=20, avg_columns=[], is_table=False):
+        self.row_header = row_header
+        self.row_format = row_format
+        self.print_every = print_every
+        self.print_period = print_period
+        self.header_every = header_every
+        self.is_table = is_table
+        
+        self.avg_idx = [row_header.index(title) for title in avg_columns]
+        
+        # Column widths fit both the titles and the values
+        widths = [max(len(title), int(fmt.split('.')[0])) for title, fmt in zip(row_header, row_format)]
+        avg_titles = ['avg ' + row_header[idx] for idx in self.avg_idx]
+        
+        self.header_line = ' '.join(title.rjust(width) for title, width in zip(row_header, widths)) + ' | ' + \
+                           ' '.join(['steps/s'.rjust(8)] + [title.rjust(max(len(title), 8)) for title in avg_titles])
+        self.line_format = ' '.join('{:' + str(width) + '.' + fmt.split('.')[1] + '}' for fmt, width in zip(row_format, widths)) + ' | ' + \
+                           ' '.join(['{:8.1f}'] + ['{:' + str(max(len(title), 8)) + '.3f}' for title in avg_titles])
+        
+        self.reset()
+        
+    def reset(self):
+        """
+        Reset the step counters and aggregates, e.g., at the start of a new episode.
+        
+        """
+        self.step_count = 0
+        self.print_count = 0
+        self.steps_since_print = 0
+        self.avg_sums = np.zeros(len(self.avg_idx))
+        self.print_time = time.monotonic()
+        
+    def report(self, row):
+        """
+        Register a simulation step with data ``row`` and print it if due.
+        
+        """
+        self.step_count += 1
+        self.steps_since_print += 1
+        
+        for k, idx in enumerate(self.avg_idx):
+            self.avg_sums[k] += row[idx]
+        
+        if (self.step_count - 1) % self.print_every != 0:
+            return
+        
+        now = time.monotonic()
+        
+        if self.print_count > 0 and now - self.print_time < self.print_period:
+            return
+        
+        if self.is_table:
+            print(tabulate([self.row_header, row], floatfmt=self.row_format, headers='firstrow', tablefmt='grid'))
+        else:
+            if self.print_count % self.header_every == 0:
+                print(self.header_line)
+            
+            elapsed = now - self.print_time
+            steps_per_sec = self.steps_since_print / elapsed if elapsed > 0 else float('nan')
+            
+            print(self.line_format.format(*row, steps_per_sec, *(self.avg_sums / self.steps_since_print)))
+        
+        self.print_count += 1
+        self.steps_since_print = 0
+        self.avg_sums[:] = 0
+        self.print_time = now
+
+def _header_file(datafile):
+    return os.path.splitext(datafile)[0] + '.json'
+
+def load_trajectory(datafile):
+    """
+    Read a trajectory file written by :class:`~loggers.TrajectoryStore`.
+    
+    Returns
+    -------
+    header : : dict
+        Header of the episode (system name, controller mode, sampling time, parameters etc.), see :func:`~loggers.Logger.write_header`. Empty if there is none.
+    data : : memory-mapped structured array of shape ``[L, ]``
+        Data rows. Columns are accessed by name, e.g., ``data['t']``, without copying.
+        
+    """
+    header = {}
+    
+    if os.path.exists(_header_file(datafile)):
+        with open(_header_file(datafile), 'r') as infile:
+            header = json.load(infile)
+    
+    data = np.load(datafile, mmap_mode='r')
+    
+    return header, data
 
 class Logger:
     """
@@ -25,70 +310,140 @@ class Logger:
         | :func:`~loggers.Logger.log_data_row` :
         | same as above, but write to a file (required).
     
+    Data rows are written via :func:`~loggers.Logger._write_data_row`, which keeps one session per data file:
+    a :class:`~loggers.TrajectoryStore` for ``.npy`` data files, a :class:`~loggers.BufferedCSVWriter` otherwise.
+    Columns are named after ``row_header``, which concrete loggers should define.
+    Call :func:`~loggers.Logger.close` to write out the remaining rows and close the files, or use the logger as a context manager.
+    Simulation steps are printed via :func:`~loggers.Logger._print_row`, which passes them to a :class:`~loggers.ConsoleReporter`.
+    By default, single-line rows are printed at most once per ``print_period`` seconds of wall-clock time. Set ``print_period = 0`` to print every step, and ``is_table = 1`` to print grid tables (slow).
+    
+    Attributes
+    ----------
+    chunk_size, flush_period : : numbers
+        Buffering parameters of data file sessions, see :class:`~loggers.BufferedCSVWriter`.
+    print_every, print_period, is_table : : numbers
+        Throttling and rendering parameters of console output, see :class:`~loggers.ConsoleReporter`.
+    row_header : : list of strings
+        Column titles with units, e.g., ``'t [s]'``. The first word of a title is the column name in trajectory files.
+    row_format : : tuple of strings
+        Float formats of the columns for console output.
+    
     """
     
+    row_header = []
+    row_format = ()
+    
+    def __init__(self, chunk_size=1000, flush_period=5.0, print_every=1, print_period=0.1, is_table=0):
+        self.chunk_size = chunk_size
+        self.flush_period = flush_period
+        self.writers = {}
+        
+        self.reporter = ConsoleReporter(self.row_header, self.row_format,
+                                        print_every=print_every,
+                                        print_period=print_period,
+                                        avg_columns=[title for title in self.row_header if title == 'stage_obj'],
+                                        is_table=is_table)
+    
     def print_sim_step():
         pass
     
     def log_data_row():
         pass
     
+    def write_header(self, datafile, header):
+        """
+        Write the header of an episode, i.e., a dictionary of, say, system name, controller mode, sampling time and parameters, into a new ``datafile``.
+        
+        For trajectory files, the header is stored as JSON next to the data file (``.json`` instead of ``.npy``).
+        For CSV files, the header is written as key-value rows followed by a row of column titles.
+        Either way, the header starts a new episode: an open session of ``datafile`` is closed and previously logged rows are discarded.
+        
+        """
+        self.close(datafile)
+        
+        if datafile.endswith('.npy'):
+            if os.path.exists(datafile):
+                os.remove(datafile)
+            
+            with open(_header_file(datafile), 'w') as outfile:
+                json.dump(header, outfile, indent=4, default=lambda value: value.tolist() if hasattr(value, 'tolist') else str(value))
+        else:
+            with open(datafile, 'w', newline='') as outfile:
+                writer = csv.writer(outfile)
+                for key, value in header.items():
+                    writer.writerow([key, str(value)])
+                writer.writerow(self.row_header)
+    
+    def _print_row(self, row):
+        self.reporter.report(row)
+    
+    def _write_data_row(self, datafile, row):
+        if datafile not in self.writers:
+            if datafile.endswith('.npy'):
+                columns = [title.split(' ')[0] for title in self.row_header]
+                self.writers[datafile] = TrajectoryStore(datafile, columns, chunk_size=self.chunk_size, flush_period=self.flush_period)
+            else:
+                self.writers[datafile] = BufferedCSVWriter(datafile, chunk_size=self.chunk_size, flush_period=self.flush_period)
+        
+        self.writers[datafile].write_row(row)
+        
+    def close(self, datafile=None):
+        """
+        Write out the buffered rows and close the session of ``datafile``, or of all data files if ``datafile`` is not specified.
+        
+        """
+        if datafile is None:
+            datafiles = list(self.writers)
+        else:
+            datafiles = [datafile] if datafile in self.writers else []
+        
+        for datafile in datafiles:
+            self.writers.pop(datafile).close()
+            
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
 class Logger3WRobot(Logger):
     """
     Data logger for a 3-wheel robot with dynamic actuators.
     
     """
-    def print_sim_step(self, t, xCoord, yCoord, alpha, v, omega, stage_obj, accum_obj, action):
-    # alphaDeg = alpha/np.pi*180      
+    row_header = ['t [s]', 'x [m]', 'y [m]', 'alpha [rad]', 'v [m/s]', 'omega [rad/s]', 'stage_obj', 'accum_obj', 'F [N]', 'M [N m]']
+    row_format = ('8.3f', '8.3f', '8.3f', '8.3f', '8.3f', '8.3f', '8.1f', '8.1f', '8.3f', '8.3f')
     
-        row_header = ['t [s]', 'x [m]', 'y [m]', 'alpha [rad]', 'v [m/s]', 'omega [rad/s]', 'stage_obj', 'accum_obj', 'F [N]', 'M [N m]']  
-        row_data = [t, xCoord, yCoord, alpha, v, omega, stage_obj, accum_obj, action[0], action[1]]  
-        row_format = ('8.3f', '8.3f', '8.3f', '8.3f', '8.3f', '8.3f', '8.1f', '8.1f', '8.3f', '8.3f')   
-        table = tabulate([row_header, row_data], floatfmt=row_format, headers='firstrow', tablefmt='grid')
-    
-        print(table)
+    def print_sim_step(self, t, xCoord, yCoord, alpha, v, omega, stage_obj, accum_obj, action):
+        self._print_row([t, xCoord, yCoord, alpha, v, omega, stage_obj, accum_obj, action[0], action[1]])
     
     def log_data_row(self, datafile, t, xCoord, yCoord, alpha, v, omega, stage_obj, accum_obj, action):
-        with open(datafile, 'a', newline='') as outfile:
-                writer = csv.writer(outfile)
-                writer.writerow([t, xCoord, yCoord, alpha, v, omega, stage_obj, accum_obj, action[0], action[1]])
+        self._write_data_row(datafile, [t, xCoord, yCoord, alpha, v, omega, stage_obj, accum_obj, action[0], action[1]])
 
 class Logger3WRobotNI(Logger):
     """
     Data logger for a 3-wheel robot with static actuators.
     
     """
-    def print_sim_step(self, t, xCoord, yCoord, alpha, stage_obj, accum_obj, action):
-    # alphaDeg = alpha/np.pi*180      
-    
-        row_header = ['t [s]', 'x [m]', 'y [m]', 'alpha [rad]', 'stage_obj', 'accum_obj', 'v [m/s]', 'omega [rad/s]']  
-        row_data = [t, xCoord, yCoord, alpha, stage_obj, accum_obj, action[0], action[1]]  
-        row_format = ('8.3f', '8.3f', '8.3f', '8.3f', '8.1f', '8.1f', '8.3f', '8.3f')   
-        table = tabulate([row_header, row_data], floatfmt=row_format, headers='firstrow', tablefmt='grid')
+    row_header = ['t [s]', 'x [m]', 'y [m]', 'alpha [rad]', 'stage_obj', 'accum_obj', 'v [m/s]', 'omega [rad/s]']
+    row_format = ('8.3f', '8.3f', '8.3f', '8.3f', '8.1f', '8.1f', '8.3f', '8.3f')
     
-        print(table)
+    def print_sim_step(self, t, xCoord, yCoord, alpha, stage_obj, accum_obj, action):
+        self._print_row([t, xCoord, yCoord, alpha, stage_obj, accum_obj, action[0], action[1]])
     
     def log_data_row(self, datafile, t, xCoord, yCoord, alpha, stage_obj, accum_obj, action):
-        with open(datafile, 'a', newline='') as outfile:
-                writer = csv.writer(outfile)
-                writer.writerow([t, xCoord, yCoord, alpha, stage_obj, accum_obj, action[0], action[1]])
+        self._write_data_row(datafile, [t, xCoord, yCoord, alpha, stage_obj, accum_obj, action[0], action[1]])
                 
 class Logger2Tank(Logger):
     """
     Data logger for a 2-tank system.
     
     """
-    def print_sim_step(self, t, h1, h2, p, stage_obj, accum_obj):
-    # alphaDeg = alpha/np.pi*180      
+    row_header = ['t [s]', 'h1', 'h2', 'p', 'stage_obj', 'accum_obj']
+    row_format = ('8.1f', '8.4f', '8.4f', '8.4f', '8.4f', '8.2f')
     
-        row_header = ['t [s]', 'h1', 'h2', 'p', 'stage_obj', 'accum_obj']  
-        row_data = [t, h1, h2, p, stage_obj, accum_obj]  
-        row_format = ('8.1f', '8.4f', '8.4f', '8.4f', '8.4f', '8.2f')   
-        table = tabulate([row_header, row_data], floatfmt=row_format, headers='firstrow', tablefmt='grid')
-    
-        print(table)
+    def print_sim_step(self, t, h1, h2, p, stage_obj, accum_obj):
+        self._print_row([t, h1, h2, p, stage_obj, accum_obj])
     
     def log_data_row(self, datafile, t, h1, h2, p, stage_obj, accum_obj):
-        with open(datafile, 'a', newline='') as outfile:
-                writer = csv.writer(outfile)
-                writer.writerow([t, h1, h2, p, stage_obj, accum_obj])                
+        self._write_data_row(datafile, [t, h1, h2, p, stage_obj, accum_obj])                
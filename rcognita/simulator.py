@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-This module contains one single class that simulates controller-system (agent-environment) loops.
+This module contains classes that simulate controller-system (agent-environment) loops.
 The system can be of three types:
     
 - discrete-time deterministic
@@ -20,6 +20,128 @@ import numpy as np
 import scipy as sp
 
 from .utilities import rej_sampling_rvs
+from .utilities import rej_sampling_rvs_batch
+
+class FixedStepSolver:
+    """
+    Lean fixed-step explicit Runge-Kutta ODE solver.
+    
+    Mimics the stepping interface of ``scipy.integrate.OdeSolver`` (attributes ``t``, ``y``, ``t_bound``, ``status`` and method ``step``) so that it can be used by :class:`~simulator.Simulator` interchangeably with ``scipy.integrate.RK45``.
+    Unlike the latter, there is no error control: each call of ``step`` advances time by exactly ``step_size`` (or less at ``t_bound``) using ``n_substeps`` equal integration steps.
+    Stage buffers are preallocated, so that a step amounts to a handful of NumPy operations besides right-hand side evaluations.
+    
+    The state ``y`` may be a vector or an array of shape ``[B, n]`` (a batch of states).
+    
+    Attributes
+    ----------
+    fun : : function
+        Right-hand side ``fun(t, y)``.
+    t0, y0 : : number, array
+        Initial time and state.
+    t_bound : : number
+        Final time.
+    step_size : : number
+        Time advanced per call of ``step``.
+    n_substeps : : natural number
+        Number of integration steps per call of ``step``.
+    method : : string
+        Integration scheme. Currently available: ``euler``, ``midpoint``, ``rk4``.
+    
+    """
+    
+    # Butcher tableaus: nodes c, Runge-Kutta matrix A (strictly lower triangular, rows as lists), weights b
+    tableaus = {'euler': ([0], [[]], [1]),
+                'midpoint': ([0, 1/2], [[], [1/2]], [0, 1]),
+                'rk4': ([0, 1/2, 1/2, 1], [[], [1/2], [0, 1/2], [0, 0, 1]], [1/6, 1/3, 1/3, 1/6])}
+    
+    def __init__(self, fun, t0, y0, t_bound, step_size, n_substeps=1, method='rk4'):
+        if method not in self.tableaus:
+            raise ValueError('Invalid integration method: ' + str(method))
+        
+        self.fun = fun
+        self.t_bound = t_bound
+        self.step_size = step_size
+        self.n_substeps = n_substeps
+        self.method = method
+        
+        self._c, self._A, self._b = self.tableaus[method]
+        self._b = np.array(self._b)
+        
+        y0 = np.array(y0, dtype=float)
+        self._K = np.zeros( (len(self._c),) + y0.shape )
+        self._y_stage = np.zeros(y0.shape)
+        self._f_old = np.zeros(y0.shape)
+        
+        self.reset(t0, y0)
+    
+    def reset(self, t0, y0):
+        """
+        Rewind the solver to the given initial time and state in place.
+        
+        """
+        self.t0 = t0
+        self.t = t0
+        self.y = np.array(y0, dtype=float)
+        self.t_old = None
+        self.y_old = None
+        self.status = 'running' if t0 < self.t_bound else 'finished'
+        
+        # Time is counted in integration steps to avoid accumulation of round-off errors
+        self._step_count = 0
+    
+    def _rk_step(self, t, y, h):
+        for i in range(len(self._c)):
+            np.copyto(self._y_stage, y)
+            for j, a in enumerate(self._A[i]):
+                if a != 0:
+                    self._y_stage += (h * a) * self._K[j]
+            self._K[i] = self.fun(t + self._c[i] * h, self._y_stage)
+        
+        return y + h * np.tensordot(self._b, self._K, axes=1)
+    
+    def step(self):
+        """
+        Advance time by ``step_size`` (not exceeding ``t_bound``).
+        
+        """
+        if self.status != 'running':
+            raise RuntimeError('Attempt to step on a failed or finished solver.')
+        
+        h = self.step_size / self.n_substeps
+        
+        self.t_old = self.t
+        self.y_old = self.y
+        
+        for k in range(self.n_substeps):
+            t_next = min(self.t0 + (self._step_count + 1) * h, self.t_bound)
+            self.y = self._rk_step(self.t, self.y, t_next - self.t)
+            self.t = t_next
+            self._step_count += 1
+            
+            if k == 0:
+                # The first stage is the derivative at the beginning of the step
+                np.copyto(self._f_old, self._K[0])
+            
+            if self.t >= self.t_bound:
+                self.status = 'finished'
+                break
+    
+    def dense_output(self):
+        """
+        Cubic Hermite interpolant of the state over the last step ``[t_old, t]``.
+        Costs one extra right-hand side evaluation.
+        
+        """
+        t_old, h = self.t_old, self.t - self.t_old
+        y_old, y = self.y_old, self.y
+        f_old, f = self._f_old.copy(), self.fun(self.t, self.y)
+        
+        def sol(t):
+            s = (t - t_old) / h
+            return ( (2*s**3 - 3*s**2 + 1) * y_old + (s**3 - 2*s**2 + s) * h * f_old
+                    + (-2*s**3 + 3*s**2) * y + (s**3 - s**2) * h * f )
+        
+        return sol
 
 class Simulator:
     """
@@ -61,6 +183,20 @@ class Simulator:
     max_step, first_step, atol, rtol : : numbers
         Parameters for an ODE solver (used if ``sys_type`` is ``diff_eqn``).
         
+    integrator : : string
+        ODE solver (used if ``sys_type`` is ``diff_eqn``):
+            
+        | ``rk45`` : adaptive ``scipy.integrate.RK45``, one step of which is done per simulation step (default)
+        | ``rk4``, ``midpoint``, ``euler`` : fixed-step :class:`~simulator.FixedStepSolver` that advances time by exactly ``dt`` per simulation step in integration steps not exceeding ``max_step``
+        
+    events : : list of functions
+        Event functions ``event(t, state)`` of the system state, an event occurring at a zero of ``event``.
+        Same as in ``scipy.integrate.solve_ivp``, a function may have attributes ``terminal`` (bool, default ``False``) and ``direction`` (number, default 0: any zero crossing; positive: crossing from negative to positive; negative: vice versa).
+        Event times are located by root-finding on the dense output of the ODE solver (used if ``sys_type`` is ``diff_eqn``; for discrete-time systems, the time step at which the sign changes is reported).
+        Once a terminal event occurs, the time and state are set to those of the event, ``is_terminated`` is raised and further simulation steps do nothing until :func:`~simulator.Simulator.reset`.
+        Occurred events are stored in ``t_events`` (one list per event function) and the index of the terminal event in ``event_idx``.
+        See :func:`~simulator.goal_reached_event`, :func:`~simulator.obstacle_contact_event`, :func:`~simulator.state_bound_event`.
+        
     See also
     --------
 
@@ -82,7 +218,9 @@ class Simulator:
                  atol=1e-5,
                  rtol=1e-3,
                  is_disturb=0,
-                 is_dyn_ctrl=0):
+                 is_dyn_ctrl=0,
+                 integrator='rk45',
+                 events=[]):
         
         """
         Parameters
@@ -120,6 +258,15 @@ class Simulator:
             
         max_step, first_step, atol, rtol : : numbers
             Parameters for an ODE solver (used if ``sys_type`` is ``diff_eqn``).
+            
+        integrator : : string
+            ODE solver (used if ``sys_type`` is ``diff_eqn``):
+                
+            | ``rk45`` : adaptive ``scipy.integrate.RK45``, one step of which is done per simulation step (default)
+            | ``rk4``, ``midpoint``, ``euler`` : fixed-step :class:`~simulator.FixedStepSolver` that advances time by exactly ``dt`` per simulation step in integration steps not exceeding ``max_step``
+            
+        events : : list of functions
+            Event functions ``event(t, state)`` of the system state with optional attributes ``terminal`` and ``direction``, see class documentation.
         """
         
         self.sys_type = sys_type
@@ -147,17 +294,91 @@ class Simulator:
         self.observation = self.sys_out(state_init)
         
         if sys_type == "diff_eqn":
-            self.ODE_solver = sp.integrate.RK45(closed_loop_rhs, t0, state_full_init, t1, max_step = dt/2, first_step=first_step, atol=atol, rtol=rtol) 
+            if integrator == 'rk45':
+                self.ODE_solver = sp.integrate.RK45(closed_loop_rhs, t0, state_full_init, t1, max_step = dt/2, first_step=first_step, atol=atol, rtol=rtol) 
+            else:
+                self.ODE_solver = FixedStepSolver(closed_loop_rhs, t0, state_full_init, t1, dt,
+                                                  n_substeps=max(int(np.ceil(dt / max_step - 1e-9)), 1),
+                                                  method=integrator)
             
         # Store these for reset purposes
         self.state_full_init = state_full_init
         self.t0 = t0
+        self.first_step = first_step
+        
+        self.events = events
+        self._reset_events()
+    
+    def _reset_events(self):
+        self.is_terminated = False
+        self.event_idx = None
+        self.t_events = [[] for _ in self.events]
+        self._event_vals = np.array([event(self.t, self.state) for event in self.events])
+    
+    def _handle_events(self, t_old):
+        """
+        Detect events that occurred during the last simulation step ``[t_old, t]`` and locate them.
+        On a terminal event, rewind time and state to the (earliest) terminal event.
+        
+        """
+        event_vals = np.array([event(self.t, self.state) for event in self.events])
+        
+        up = (self._event_vals <= 0) & (event_vals >= 0)
+        down = (self._event_vals >= 0) & (event_vals <= 0)
+        
+        self._event_vals = event_vals
+        
+        active = []
+        for idx, event in enumerate(self.events):
+            direction = getattr(event, 'direction', 0)
+            if (direction > 0 and up[idx]) or (direction < 0 and down[idx]) or (direction == 0 and (up[idx] or down[idx])):
+                active.append(idx)
+        
+        if not active:
+            return
+        
+        if self.sys_type == "diff_eqn":
+            sol = self.ODE_solver.dense_output()
+            
+            t_active = []
+            for idx in active:
+                event = self.events[idx]
+                if event(t_old, sol(t_old)[0:self.dim_state]) == 0:
+                    t_active.append(t_old)
+                else:
+                    t_active.append( sp.optimize.brentq(lambda t: event(t, sol(t)[0:self.dim_state]), t_old, self.t, xtol=4*np.finfo(float).eps) )
+        else:
+            t_active = [self.t] * len(active)
+        
+        t_terminal = np.inf
+        for idx, t_event in zip(active, t_active):
+            if getattr(self.events[idx], 'terminal', False) and t_event < t_terminal:
+                t_terminal = t_event
+                self.event_idx = idx
+        
+        for idx, t_event in zip(active, t_active):
+            if t_event <= t_terminal:
+                self.t_events[idx].append(t_event)
+        
+        if self.event_idx is not None:
+            self.is_terminated = True
+            
+            if self.sys_type == "diff_eqn":
+                self.t = t_terminal
+                self.state_full = sol(t_terminal)
+                self.state = self.state_full[0:self.dim_state]
+                self.observation = self.sys_out(self.state)
     
     def sim_step(self):
         """
         Do one simulation step and update current simulation data (time, system state and output). 
 
         """
+        if self.is_terminated:
+            return
+        
+        t_old = self.t
+        
         if self.sys_type == "diff_eqn":
             self.ODE_solver.step()
             
@@ -175,7 +396,8 @@ class Simulator:
             self.observation = self.sys_out(self.state)
             
         elif self.sys_type == "discr_prob":
-            self.state_full = rej_sampling_rvs(self.dim_state, self.closed_loop_rhs, 10)
+            # The closed-loop description is the transition density of the next state from the current one
+            self.state_full = rej_sampling_rvs(self.dim_state, lambda state_next: self.closed_loop_rhs(self.t, state_next), 10)
             
             self.t = self.t + self.dt
             
@@ -183,6 +405,9 @@ class Simulator:
             self.observation = self.sys_out(self.state)           
         else:
             raise ValueError('Invalid system description')
+        
+        if self.events:
+            self._handle_events(t_old)
             
     def get_sim_step_data(self):
         """
@@ -195,10 +420,245 @@ class Simulator:
         return t, state, observation, state_full
     
     def reset(self):
+        """
+        Rewind simulation to the initial time and state for use in multi-episode simulation.
+        
+        The ODE solver is reset in place rather than re-created: time, state, step size history and evaluation counters are rewound, while the internal buffers are reused.
+        The derivative at the initial state is re-evaluated with the action currently stored in the system.
+        If ``first_step`` is ``None``, ``RK45`` is re-created instead, so that it selects the initial step itself.
+        
+        """
+        self.t = self.t0
+        self.state_full = self.state_full_init
+        self.state = self.state_full[0:self.dim_state]
+        self.observation = self.sys_out(self.state)
+        
         if self.sys_type == "diff_eqn":
-            self.ODE_solver.status = 'running'
-            self.ODE_solver.t = self.t0
-            self.ODE_solver.observation = self.state_full_init
+            if isinstance(self.ODE_solver, FixedStepSolver):
+                self.ODE_solver.reset(self.t0, self.state_full_init)
+            elif self.first_step is None:
+                solver = self.ODE_solver
+                self.ODE_solver = sp.integrate.RK45(self.closed_loop_rhs, self.t0, self.state_full_init, solver.t_bound,
+                                                    max_step=solver.max_step, atol=solver.atol, rtol=solver.rtol)
+            else:
+                solver = self.ODE_solver
+                solver.t = self.t0
+                solver.t_old = None
+                solver.y = np.array(self.state_full_init, dtype=float)
+                solver.y_old = None
+                solver.status = 'running'
+                solver.nfev, solver.njev, solver.nlu = 0, 0, 0
+                solver.f = solver.fun(solver.t, solver.y)
+                solver.h_abs = self.first_step
+                solver.h_previous = None
+        
+        self._reset_events()
+
+def goal_reached_event(goal, radius):
+    """
+    Terminal event for :class:`~simulator.Simulator`: the system reaches the ball of radius ``radius`` around ``goal``.
+    The first ``len(goal)`` state components are taken as coordinates, e.g., ``[x, y]`` of a robot.
+    
+    """
+    goal = np.array(goal)
+    
+    def event(t, state):
+        return np.linalg.norm(state[0:goal.size] - goal) - radius
+    
+    event.terminal = True
+    event.direction = -1
+    
+    return event
+
+def obstacle_contact_event(center, radius):
+    """
+    Terminal event for :class:`~simulator.Simulator`: the system hits a circular obstacle of radius ``radius`` around ``center``.
+    The first ``len(center)`` state components are taken as coordinates.
+    
+    """
+    center = np.array(center)
+    
+    def event(t, state):
+        return np.linalg.norm(state[0:center.size] - center) - radius
+    
+    event.terminal = True
+    event.direction = -1
+    
+    return event
+
+def state_bound_event(idx, lower=-np.inf, upper=np.inf):
+    """
+    Terminal event for :class:`~simulator.Simulator`: the state component ``idx`` leaves the interval ``[lower, upper]``.
+    
+    """
+    
+    def event(t, state):
+        return min(state[idx] - lower, upper - state[idx])
+    
+    event.terminal = True
+    event.direction = -1
+    
+    return event
+
+class BatchSimulator:
+    """
+    Class for simulating a batch of closed loops (system-controllers) that share one system description, but start from different initial conditions.
+    
+    The closed-loop states of all ``B`` episodes are stored as a single array of shape ``[B, n]`` and advanced together by one vectorized :class:`~simulator.FixedStepSolver` call per simulation step.
+    Each simulation step advances time by exactly ``dt``.
+    Episodes are terminated individually via the termination mask ``is_done``: terminated episodes are frozen and not advanced any more.
+    
+    Attributes
+    ----------
+    sys_type : : string
+        Type of system by description, see :class:`~simulator.Simulator`.
+    closed_loop_rhs : : function
+        Batched right-hand side description of the closed-loop system: maps ``t`` and full states of shape ``[B, n]`` to an array of the same shape.
+        Say, if you instantiated a concrete system as ``my_sys``, this could be just ``my_sys.closed_loop_rhs_batch``.
+        For ``discr_prob``, it maps ``t`` and candidate next states of shape ``[B, dim_state]`` to their transition densities, an array of shape ``[B, ]``,
+        where row ``b`` is evaluated from the current state of episode ``b``. The next states are drawn by :func:`~utilities.rej_sampling_rvs_batch`.
+    sys_out : : function
+        System output function. Must accept states of shape ``[B, dim_state]``.
+        The default output of ``System`` (identical to state) complies with this.
+    is_dyn_ctrl : : 0 or 1
+        If 1, the controller (a.k.a. agent) is considered as a part of the full state vector.
+    state_init, disturb_init, action_init : : arrays of shape ``[B, dim_state]``, ``[B, dim_disturb]``, ``[B, dim_input]``
+        Initial values of the (open-loop) system states, disturbances and inputs, one episode per row.
+    t0, t1, dt : : numbers
+        Initial, final times and time step size.
+    max_step : : number
+        Maximal integration step size (used if ``sys_type`` is ``diff_eqn``). Each time step ``dt`` is split into the least number of equal integration steps not exceeding ``max_step``.
+    integrator : : string
+        Fixed-step integration scheme (used if ``sys_type`` is ``diff_eqn``): ``rk4`` (default), ``midpoint`` or ``euler``.
+    termination_fnc : : function
+        Optional episode termination criterion that maps ``t`` and current observations of shape ``[B, dim_output]`` to a boolean array of shape ``[B,]``, e.g., goal reached.
+        
+    See also
+    --------
+
+    :class:`~simulator.Simulator`, :func:`~systems.System.closed_loop_rhs_batch`
+   
+    """
+    
+    def __init__(self, sys_type,
+                 closed_loop_rhs,
+                 sys_out,
+                 state_init,
+                 disturb_init=[],
+                 action_init=[],
+                 t0=0,
+                 t1=1,
+                 dt=1e-2,
+                 max_step=0.5e-2,
+                 is_disturb=0,
+                 is_dyn_ctrl=0,
+                 termination_fnc=None,
+                 integrator='rk4'):
+        
+        if sys_type not in ["diff_eqn", "discr_fnc", "discr_prob"]:
+            raise ValueError('Invalid system description for batched simulation')
+        
+        self.sys_type = sys_type
+        self.closed_loop_rhs = closed_loop_rhs
+        self.sys_out = sys_out
+        self.dt = dt
+        self.t1 = t1
+        self.termination_fnc = termination_fnc
+        
+        # Build full states of the closed-loops
+        if is_dyn_ctrl:
+            if is_disturb:
+                state_full_init = np.hstack([state_init, disturb_init, action_init])
+            else:
+                state_full_init = np.hstack([state_init, action_init])
         else:
-            self.t = self.t0
-            self.state_full = self.state_full_init
\ No newline at end of file
+            if is_disturb:
+                state_full_init = np.hstack([state_init, disturb_init])
+            else:
+                state_full_init = np.array(state_init, dtype=float)
+        
+        self.state_full = state_full_init
+        
+        self.t = t0
+        self.dim_state = state_init.shape[1]
+        self.batch_size = state_init.shape[0]
+        self.state = self.state_full[:, 0:self.dim_state]
+        self.observation = self.sys_out(self.state)
+        
+        self.is_done = np.zeros(self.batch_size, dtype=bool)
+        
+        # Time is counted in steps to avoid accumulation of round-off errors
+        self.step_count = 0
+        
+        if sys_type == "diff_eqn":
+            self.ODE_solver = FixedStepSolver(closed_loop_rhs, t0, state_full_init, t1, dt,
+                                              n_substeps=max(int(np.ceil(dt / max_step - 1e-9)), 1),
+                                              method=integrator)
+        
+        # Store these for reset purposes
+        self.state_full_init = state_full_init
+        self.t0 = t0
+        
+    def sim_step(self):
+        """
+        Do one simulation step for all running episodes and update current simulation data (time, system states and outputs, termination mask).
+
+        """
+        if self.is_done.all():
+            return
+        
+        if self.sys_type == "diff_eqn":
+            self.ODE_solver.step()
+            state_full_next = self.ODE_solver.y
+            
+        elif self.sys_type == "discr_fnc":
+            state_full_next = self.closed_loop_rhs(self.t + self.dt, self.state_full)
+            
+        elif self.sys_type == "discr_prob":
+            state_full_next = rej_sampling_rvs_batch(self.dim_state, lambda states_next: self.closed_loop_rhs(self.t, states_next), 10,
+                                                     self.batch_size, is_ensemble=1)
+        
+        self.step_count += 1
+        self.t = self.t0 + self.step_count * self.dt
+        
+        # Terminated episodes are frozen
+        self.state_full = np.where(self.is_done[:, None], self.state_full, state_full_next)
+        
+        if self.sys_type == "diff_eqn":
+            self.ODE_solver.y = self.state_full
+        
+        self.state = self.state_full[:, 0:self.dim_state]
+        self.observation = self.sys_out(self.state)
+        
+        if self.termination_fnc is not None:
+            self.is_done = self.is_done | self.termination_fnc(self.t, self.observation)
+        
+        if self.t >= self.t1:
+            self.is_done[:] = True
+    
+    def get_sim_step_data(self):
+        """
+        Collect current simulation data: time, system states and outputs, and, for completeness, full closed-loop states.
+        The termination mask is available as ``is_done``.
+
+        """
+        
+        t, state, observation, state_full = self.t, self.state, self.observation, self.state_full
+        
+        return t, state, observation, state_full
+    
+    def reset(self):
+        """
+        Rewind all episodes to the initial time and states and clear the termination mask.
+        
+        """
+        self.t = self.t0
+        self.step_count = 0
+        self.state_full = self.state_full_init
+        
+        if self.sys_type == "diff_eqn":
+            self.ODE_solver.reset(self.t0, self.state_full_init)
+        
+        self.state = self.state_full[:, 0:self.dim_state]
+        self.observation = self.sys_out(self.state)
+        self.is_done = np.zeros(self.batch_size, dtype=bool)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module contains a parameter sweep engine that runs benchmark episodes of controllers over a grid of parameters in parallel.
+
+Remarks:
+
+- All vectors are treated as of type [n,]
+- All buffers are treated as of type [L, n] where each row is a vector
+- Buffers are updated from bottom to top
+
+"""
+
+import numpy as np
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from collections import namedtuple
+
+# Result of one episode of a parameter sweep: label and parameters of the set, episode data (``None`` on failure), wall-clock time, error message (``None`` on success)
+SweepResult = namedtuple('SweepResult', ['label', 'pars', 'data', 'wall_time', 'error'])
+
+def rollout_3wrobot(ctrl, state_init, state_goal, sampling_time=0.1, t1=20.0):
+    """
+    Episode of a kinematic 3-wheel robot under a sampled controller, integrated by the forward Euler scheme with step ``sampling_time``.
+    The controller is queried as ``ctrl.compute_action(t, observation)`` with ``observation = [state, state_goal]``.
+
+    Returns
+    -------
+    data : : dict
+        ``t`` : times of shape ``[L, ]``, ``state`` : states of shape ``[L+1, 3]`` including the final one, ``action`` : actions of shape ``[L, 2]``.
+
+    """
+    state = np.array(state_init, dtype=float)
+
+    Nsteps = int(np.ceil(t1 / sampling_time - 1e-9))
+
+    ts = sampling_time * np.arange(Nsteps)
+    states = np.zeros([Nsteps + 1, 3])
+    actions = np.zeros([Nsteps, 2])
+
+    states[0, :] = state
+
+    for k in range(Nsteps):
+        observation = np.concatenate([state, state_goal])
+        action = ctrl.compute_action(ts[k], observation)
+
+        state = state + sampling_time * np.array([action[0] * np.cos(state[2]),
+                                                  action[0] * np.sin(state[2]),
+                                                  action[1]])
+
+        states[k + 1, :] = state
+        actions[k, :] = action
+
+    return {'t': ts, 'state': states, 'action': actions}
+
+def _run_sweep_point(label, ctrl_factory, pars, episode_fnc, episode_kwargs):
+    """
+    Construct a controller and run one episode. Executed in a worker process, so that controllers with heavy construction (e.g., CasADi solvers) are built there.
+
+    """
+    tic = time.perf_counter()
+
+    try:
+        ctrl = ctrl_factory(**pars)
+        data = episode_fnc(ctrl, **episode_kwargs)
+        error = None
+    except Exception as e:
+        data = None
+        error = repr(e)
+
+    return SweepResult(label, pars, data, time.perf_counter() - tic, error)
+
+def run_sweep(ctrl_factory, par_grid, episode_fnc=rollout_3wrobot, episode_kwargs=None, max_workers=None):
+    """
+    Run one episode per parameter set over a process pool.
+
+    Parameters
+    ----------
+    ctrl_factory : : function or class
+        Controller constructor called as ``ctrl_factory(**pars)`` inside the worker, e.g., ``controllers.CtrlKinematic``.
+        Must be picklable, i.e., defined at module level.
+    par_grid : : dict or list of dicts
+        Parameter sets, either labeled as ``{label: pars}`` (like ``gain_sets`` in the presets), or as a list, in which case the labels are ``set1``, ``set2`` etc.
+    episode_fnc : : function
+        Episode routine called as ``episode_fnc(ctrl, **episode_kwargs)`` that returns the episode data. Must be picklable.
+        Defaults to :func:`~sweeps.rollout_3wrobot`.
+    episode_kwargs : : dict
+        Fixed episode parameters shared by all parameter sets, e.g., initial and goal states. If ``None``, no parameters are passed.
+    max_workers : : natural number
+        Number of worker processes. If ``None``, equals the number of processors. If 1, episodes are run in the calling process.
+
+    Returns
+    -------
+    results : : list of :class:`~sweeps.SweepResult`
+        In the order of ``par_grid``.
+
+    """
+    if episode_kwargs is None:
+        episode_kwargs = {}
+
+    if not isinstance(par_grid, dict):
+        par_grid = {'set' + str(k+1): pars for k, pars in enumerate(par_grid)}
+
+    if max_workers == 1:
+        results = [_run_sweep_point(label, ctrl_factory, pars, episode_fnc, episode_kwargs) for label, pars in par_grid.items()]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_run_sweep_point, label, ctrl_factory, pars, episode_fnc, episode_kwargs) for label, pars in par_grid.items()]
+            results = [future.result() for future in futures]
+
+    for result in results:
+        if result.error is not None:
+            warnings.warn('Episode ' + result.label + ' failed: ' + result.error)
+
+    return results
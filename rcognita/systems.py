@@ -13,6 +13,7 @@ Remarks:
 
 import numpy as np
 from numpy.random import randn
+from scipy.linalg import expm
 
 class System:
     """
@@ -27,6 +28,12 @@ class System:
         | right-hand side of controller dynamical model (if necessary)
         | :func:`~systems.system.out` :
         | system out (if not overridden, output is identical to state)
+        | :func:`~systems.system.jacobian_state`, :func:`~systems.system.jacobian_action` :
+        | Jacobians of the right-hand side of system description (optional, computed numerically by default)
+        | :func:`~systems.system._state_dyn_into` :
+        | in-place version of :func:`~systems.system._state_dyn` (optional, speeds up :func:`~systems.system.closed_loop_rhs`)
+        | :func:`~systems.system._state_dyn_batch` :
+        | vectorized version of :func:`~systems.system._state_dyn` over batches of states and actions (optional, speeds up batched simulation and prediction)
       
     Attributes
     ----------
@@ -62,6 +69,9 @@ class System:
         If 0, no disturbance is fed into the system
     pars_disturb : : list
         Parameters of the disturbance model
+    is_fast_rhs : : 0 or 1
+        If 1, :func:`~systems.system.closed_loop_rhs` clips the action into a preallocated buffer, leaving the stored action intact,
+        and writes the dynamics in place via :func:`~systems.system._state_dyn_into`
         
    Each concrete system must realize ``System`` and define ``name`` attribute.   
         
@@ -76,7 +86,8 @@ class System:
                  ctrl_bnds=[],
                  is_dyn_ctrl=0,
                  is_disturb=0,
-                 pars_disturb=[]):
+                 pars_disturb=[],
+                 is_fast_rhs=1):
         
         """
         Parameters
@@ -113,6 +124,9 @@ class System:
             If 0, no disturbance is fed into the system
         pars_disturb : : list
             Parameters of the disturbance model        
+        is_fast_rhs : : 0 or 1
+            If 1, :func:`~systems.system.closed_loop_rhs` clips the action into a preallocated buffer, leaving the stored action intact,
+            and writes the dynamics in place via :func:`~systems.system._state_dyn_into`
         """
         
         self.sys_type = sys_type
@@ -126,6 +140,7 @@ class System:
         self.is_dyn_ctrl = is_dyn_ctrl
         self.is_disturb = is_disturb
         self.pars_disturb = pars_disturb
+        self.is_fast_rhs = is_fast_rhs
         
         # Track system's state
         self._state = np.zeros(dim_state)
@@ -143,6 +158,17 @@ class System:
                 self._dim_full_state = self.dim_state + self.dim_disturb
             else:
                 self._dim_full_state = self.dim_state
+        
+        # Control bounds as arrays for one-shot clipping, ``None`` if control is unconstrained
+        if np.size(ctrl_bnds) > 0 and np.any(ctrl_bnds):
+            self._action_min = np.array(ctrl_bnds, dtype=float)[:, 0]
+            self._action_max = np.array(ctrl_bnds, dtype=float)[:, 1]
+        else:
+            self._action_min = None
+            self._action_max = None
+        
+        # Buffer for the clipped action in closed_loop_rhs
+        self._action_clipped = np.zeros(dim_input)
             
     def _state_dyn(self, t, state, action, disturb):
         """
@@ -153,6 +179,128 @@ class System:
         """
         pass
 
+    def _state_dyn_into(self, t, state, action, disturb, Dstate):
+        """
+        Same as :func:`~systems.system._state_dyn`, but writes the result into the array ``Dstate`` of shape ``[dim_state, ]``.
+        Override with in-place writes to avoid temporary arrays. By default, copies the result of :func:`~systems.system._state_dyn`.
+        
+        """
+        Dstate[:] = self._state_dyn(t, state, action, disturb)
+
+    def _state_dyn_batch(self, t, states, actions, disturbs=[]):
+        """
+        Batched counterpart of :func:`~systems.system._state_dyn` for ``sys_type = "diff_eqn"`` and ``"discr_fnc"``.
+        
+        Parameters
+        ----------
+        states : : array of shape ``[B, dim_state]``
+            States, one per row
+        actions : : array of shape ``[B, dim_input]`` or ``[dim_input, ]``
+            Actions, one per row, or a single action shared by all states
+        disturbs : : array of shape ``[B, dim_disturb]`` or ``[dim_disturb, ]``
+            Disturbances, empty if there are none
+        
+        Returns
+        -------
+        Dstates : : array of shape ``[B, dim_state]``
+        
+        Concrete systems should override this method by a vectorized implementation. By default, :func:`~systems.system._state_dyn` is called row by row.
+        
+        """
+        states = np.atleast_2d(states)
+        B = states.shape[0]
+        
+        actions = np.broadcast_to(actions, (B, self.dim_input))
+        
+        if np.size(disturbs) > 0:
+            disturbs = np.broadcast_to(disturbs, (B, self.dim_disturb))
+        else:
+            disturbs = np.zeros([B, 0])
+        
+        # The data type follows the results, so that a complex step is detected to pass through, see _jacobian_num
+        Dstates = np.array([self._state_dyn(t, states[b], actions[b], disturbs[b]) for b in range(B)])
+        
+        return Dstates.reshape([B, self.dim_state])
+
+    def _jacobian_num(self, t, state, action, wrt):
+        """
+        Numerical Jacobian of :func:`~systems.system._state_dyn` (without disturbance) with respect to ``state`` (``wrt = 0``) or ``action`` (``wrt = 1``).
+        
+        All perturbed arguments are evaluated in one call of :func:`~systems.system._state_dyn_batch`.
+        The complex step :math:`\\partial f / \\partial z_i = \\text{Im} \\, f(z + \\mathrm{i} h e_i) / h` is exact up to round-off for dynamics built of analytic functions.
+        If the dynamics do not propagate complex values (e.g., they write into real arrays or use ``abs``, ``np.clip``), central differences are used instead.
+        
+        """
+        state = np.asarray(state, dtype=float)
+        action = np.asarray(action, dtype=float)
+        
+        args = [state, action]
+        dim = args[wrt].size
+        
+        # Complex step
+        h = 1e-20
+        args_pert = [np.tile(arg, (dim, 1)).astype(complex) for arg in args]
+        args_pert[wrt] += 1j * h * np.eye(dim)
+        
+        with np.errstate(all='ignore'):
+            Dstates = self._state_dyn_batch(t, args_pert[0], args_pert[1])
+        
+        if np.iscomplexobj(Dstates) and np.all(np.isfinite(Dstates)):
+            return np.imag(Dstates).T / h
+        
+        # Central differences
+        h = np.cbrt(np.finfo(float).eps) * np.maximum(1, np.abs(args[wrt]))
+        args_pert = [np.tile(arg, (2 * dim, 1)) for arg in args]
+        args_pert[wrt] += np.vstack([np.diag(h), -np.diag(h)])
+        
+        Dstates = self._state_dyn_batch(t, args_pert[0], args_pert[1])
+        
+        return (Dstates[:dim] - Dstates[dim:]).T / (2 * h)
+
+    def jacobian_state(self, t, state, action):
+        """
+        Jacobian of :func:`~systems.system._state_dyn` (without disturbance) with respect to ``state``, an array of shape ``[dim_state, dim_state]``.
+        Computed numerically by default, see :func:`~systems.system._jacobian_num`. Override with an analytic expression if available.
+        
+        """
+        return self._jacobian_num(t, state, action, 0)
+    
+    def jacobian_action(self, t, state, action):
+        """
+        Jacobian of :func:`~systems.system._state_dyn` (without disturbance) with respect to ``action``, an array of shape ``[dim_state, dim_input]``.
+        Computed numerically by default, see :func:`~systems.system._jacobian_num`. Override with an analytic expression if available.
+        
+        """
+        return self._jacobian_num(t, state, action, 1)
+    
+    def linearize_discr(self, state, action, sampling_time, t=0):
+        """
+        Discrete-time linearization :math:`\\delta state^+ = A \\delta state + B \\delta action` at the operating point ``(state, action)``.
+        
+        For ``sys_type = "diff_eqn"``, the Jacobians :math:`A_c, B_c` are discretized exactly under zero-order hold of the action over ``sampling_time``:
+        :math:`\\begin{bmatrix} A & B \\\\ 0 & I \\end{bmatrix} = \\exp \\left( \\begin{bmatrix} A_c & B_c \\\\ 0 & 0 \\end{bmatrix} \\cdot sampling\\_time \\right)`.
+        For ``sys_type = "discr_fnc"``, the Jacobians themselves are returned.
+        
+        Returns
+        -------
+        A : : array of shape ``[dim_state, dim_state]``
+        B : : array of shape ``[dim_state, dim_input]``
+        
+        """
+        Ac = self.jacobian_state(t, state, action)
+        Bc = self.jacobian_action(t, state, action)
+        
+        if self.sys_type == "discr_fnc":
+            return Ac, Bc
+        
+        M = np.zeros([self.dim_state + self.dim_input, self.dim_state + self.dim_input])
+        M[:self.dim_state, :self.dim_state] = Ac
+        M[:self.dim_state, self.dim_state:] = Bc
+        
+        Md = expm(M * sampling_time)
+        
+        return Md[:self.dim_state, :self.dim_state], Md[:self.dim_state, self.dim_state:]
+
     def _disturb_dyn(self, t, disturb):
         """
         Dynamical disturbance model depending on the system type:
@@ -221,6 +369,9 @@ class System:
             Current closed-loop system state        
         
         """
+        if self.is_fast_rhs:
+            return self._closed_loop_rhs_fast(t, state_full)
+        
         rhs_full_state = np.zeros(self._dim_full_state)
         
         state = state_full[0:self.dim_state]
@@ -233,7 +384,7 @@ class System:
         if self.is_dyn_ctrl:
             action = state_full[-self.dim_input:]
             observation = self.out(state)
-            rhs_full_state[-self.dim_input:] = self._ctrlDyn(t, action, observation)
+            rhs_full_state[-self.dim_input:] = self._ctrl_dyn(t, action, observation)
         else:
             # Fetch the control action stored in the system
             action = self.action
@@ -251,6 +402,86 @@ class System:
         self._state = state
         
         return rhs_full_state    
+
+    def _closed_loop_rhs_fast(self, t, state_full):
+        """
+        Fast path of :func:`~systems.System.closed_loop_rhs`.
+        The only array allocated is the returned one: ODE solvers keep previous right-hand sides, so it may not be a reused buffer.
+        
+        """
+        rhs_full_state = np.empty(self._dim_full_state)
+        
+        state = state_full[0:self.dim_state]
+        
+        if self.is_disturb:
+            disturb = state_full[self.dim_state:self.dim_state + self.dim_disturb]
+        else:
+            disturb = []
+        
+        if self.is_dyn_ctrl:
+            action = state_full[-self.dim_input:]
+            rhs_full_state[-self.dim_input:] = self._ctrl_dyn(t, action, self.out(state))
+        else:
+            # Fetch the control action stored in the system
+            action = self.action
+        
+        if self._action_min is not None:
+            action = np.clip(action, self._action_min, self._action_max, out=self._action_clipped)
+        
+        self._state_dyn_into(t, state, action, disturb, rhs_full_state[0:self.dim_state])
+        
+        if self.is_disturb:
+            rhs_full_state[self.dim_state:self.dim_state + self.dim_disturb] = self._disturb_dyn(t, disturb)
+        
+        # Track system's state
+        self._state = state
+        
+        return rhs_full_state
+
+    def closed_loop_rhs_batch(self, t, states_full):
+        """
+        Batched counterpart of :func:`~systems.System.closed_loop_rhs` for simulating ``B`` episodes at once, e.g., by :class:`~simulator.BatchSimulator`.
+        
+        The action stored in the system (see :func:`~systems.System.receive_action`) may be either a single vector shared by all episodes or an array of shape ``[B, dim_input]``.
+        
+        Attributes
+        ----------
+        states_full : : array of shape ``[B, dim_full_state]``
+            Current closed-loop system states, one episode per row
+        
+        """
+        B = states_full.shape[0]
+        
+        rhs_full_states = np.zeros([B, self._dim_full_state])
+        
+        states = states_full[:, 0:self.dim_state]
+        
+        if self.is_disturb:
+            disturbs = states_full[:, self.dim_state:self.dim_state + self.dim_disturb]
+        else:
+            disturbs = np.zeros([B, 0])
+        
+        if self.is_dyn_ctrl:
+            actions = states_full[:, -self.dim_input:]
+            for b in range(B):
+                rhs_full_states[b, -self.dim_input:] = self._ctrl_dyn(t, actions[b], self.out(states[b]))
+        else:
+            # Fetch the control actions stored in the system
+            actions = np.broadcast_to(self.action, (B, self.dim_input))
+        
+        if self._action_min is not None:
+            actions = np.clip(actions, self._action_min, self._action_max)
+        
+        rhs_full_states[:, 0:self.dim_state] = self._state_dyn_batch(t, states, actions, disturbs)
+        
+        if self.is_disturb:
+            for b in range(B):
+                rhs_full_states[b, self.dim_state:self.dim_state + self.dim_disturb] = self._disturb_dyn(t, disturbs[b])
+        
+        # Track system's states
+        self._state = states
+        
+        return rhs_full_states
     
 class Sys3WRobotNI(System):
     def __init__(self, *args, **kwargs):
@@ -271,6 +502,41 @@ class Sys3WRobotNI(System):
 
         return np.array([dx, dy, dtheta])
 
+    def _state_dyn_into(self, t, state, action, disturb, Dstate):
+        theta = state[2]
+        v = action[0]
+        
+        Dstate[0] = v * np.cos(theta)
+        Dstate[1] = v * np.sin(theta)
+        Dstate[2] = action[1]
+
+    def _state_dyn_batch(self, t, states, actions, disturbs=[]):
+        # Leading dimensions of states and actions broadcast against each other
+        theta = states[..., 2]
+        v = actions[..., 0]
+        
+        Dstates = np.empty(np.broadcast_shapes(states.shape[:-1], actions.shape[:-1]) + (self.dim_state,), dtype=np.result_type(states, actions, float))
+        Dstates[..., 0] = v * np.cos(theta)
+        Dstates[..., 1] = v * np.sin(theta)
+        Dstates[..., 2] = actions[..., 1]
+        
+        return Dstates
+
+    def jacobian_state(self, t, state, action):
+        theta = state[2]
+        v = action[0]
+        
+        return np.array([[0, 0, -v * np.sin(theta)],
+                         [0, 0,  v * np.cos(theta)],
+                         [0, 0,  0]])
+    
+    def jacobian_action(self, t, state, action):
+        theta = state[2]
+        
+        return np.array([[np.cos(theta), 0],
+                         [np.sin(theta), 0],
+                         [0,             1]])
+
 
         
 
@@ -316,6 +582,43 @@ class Sys3WRobot(System):
         Dstate[3] = 1 / m * action[0]
         Dstate[4] = 1 / I * action[1]
         return Dstate
+    
+    def _state_dyn_into(self, t, state, action, disturb, Dstate):
+        m, I = self.pars[0], self.pars[1]
+        Dstate[0] = state[3] * np.cos(state[2])
+        Dstate[1] = state[3] * np.sin(state[2])
+        Dstate[2] = state[4]
+        Dstate[3] = 1 / m * action[0]
+        Dstate[4] = 1 / I * action[1]
+    
+    def _state_dyn_batch(self, t, states, actions, disturbs=[]):
+        m, I = self.pars[0], self.pars[1]
+        
+        Dstates = np.empty(np.broadcast_shapes(states.shape[:-1], actions.shape[:-1]) + (self.dim_state,), dtype=np.result_type(states, actions, float))
+        Dstates[..., 0] = states[..., 3] * np.cos(states[..., 2])
+        Dstates[..., 1] = states[..., 3] * np.sin(states[..., 2])
+        Dstates[..., 2] = states[..., 4]
+        Dstates[..., 3] = 1 / m * actions[..., 0]
+        Dstates[..., 4] = 1 / I * actions[..., 1]
+        
+        return Dstates
+    
+    def jacobian_state(self, t, state, action):
+        theta, v = state[2], state[3]
+        Jstate = np.zeros([self.dim_state, self.dim_state])
+        Jstate[0, 2] = -v * np.sin(theta)
+        Jstate[0, 3] = np.cos(theta)
+        Jstate[1, 2] = v * np.cos(theta)
+        Jstate[1, 3] = np.sin(theta)
+        Jstate[2, 4] = 1
+        return Jstate
+    
+    def jacobian_action(self, t, state, action):
+        m, I = self.pars[0], self.pars[1]
+        Jaction = np.zeros([self.dim_state, self.dim_input])
+        Jaction[3, 0] = 1 / m
+        Jaction[4, 1] = 1 / I
+        return Jaction
 
     def out(self, state, action=[]):
         return state
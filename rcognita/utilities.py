@@ -14,11 +14,20 @@ Remarks:
 import numpy as np
 from numpy.random import rand
 from numpy.matlib import repmat
-import scipy.stats as st
 from scipy import signal
 import matplotlib.pyplot as plt
+import warnings
 
-def rej_sampling_rvs(dim, pdf, M):
+def _std_normal_pdf(samples):
+    """
+    Density of the standard normal distribution at the rows of ``samples`` of shape ``[K, dim]``. Proposal of the rejection samplers.
+    
+    """
+    dim = samples.shape[-1]
+    
+    return (2 * np.pi)**(-dim / 2) * np.exp(-0.5 * np.sum(samples**2, axis=-1))
+
+def rej_sampling_rvs(dim, pdf, M, max_iters=1000):
     """
     Random variable (pseudo)-realizations via rejection sampling.
     
@@ -32,28 +41,123 @@ def rej_sampling_rvs(dim, pdf, M):
         it must hold that :math:`\\text{pdf}_{\\text{desired}} \le M \\text{pdf}_{\\text{proposal}}`.
         This function uses a normal pdf with zero mean and identity covariance matrix as a proposal distribution.
         The smaller `M` is, the fewer iterations to produce a sample are expected.
+    max_iters : : natural number
+        Maximal number of proposals. If none is accepted, the one with the largest acceptance ratio is returned with a warning.
 
     Returns
     -------
     A single realization (in general, as a vector) of the random variable with the desired probability density.
+    
+    See also
+    --------
+    :func:`~utilities.rej_sampling_rvs_batch` for many realizations at once with a vectorized ``pdf``
 
     """
     
-    # Use normal pdf with zero mean and identity covariance matrix as a proposal distribution
-    normal_RV = st.multivariate_normal(cov=np.eye(dim))
+    # Proposals and uniform samples are drawn in blocks of the expected number of proposals per realization
+    block_size = int(min(np.ceil(M), max_iters))
     
-    # Bound the number of iterations to avoid too long loops
-    max_iters = 1e3
+    ratio_best = -np.inf
     
     curr_iter = 0
     
-    while curr_iter <= max_iters:
-        proposal_sample = normal_RV.rvs()
+    while curr_iter < max_iters:
+        proposal_samples = np.random.randn(block_size, dim)
+        unif_samples = rand(block_size)
+        proposal_pdfs = _std_normal_pdf(proposal_samples)
+        
+        for k in range(block_size):
+            ratio = pdf(proposal_samples[k]) / M / proposal_pdfs[k]
+            
+            if unif_samples[k] < ratio:
+                return proposal_samples[k]
+            
+            if ratio > ratio_best:
+                ratio_best = ratio
+                sample_best = proposal_samples[k]
+        
+        curr_iter += block_size
+    
+    warnings.warn('Rejection sampling did not accept any of ' + str(curr_iter) + ' proposals. Returning the most likely one')
+    
+    return sample_best
+
+def rej_sampling_rvs_batch(dim, pdf, M, n_samples, max_iters=1000, is_ensemble=0):
+    """
+    Many random variable (pseudo)-realizations at once via rejection sampling with a vectorized ``pdf``, see :func:`~utilities.rej_sampling_rvs`.
+    
+    Parameters
+    ----------
+    dim : : integer
+        dimension of the random variable
+    pdf : : function
+        Desired probability density function, vectorized: maps an array of shape ``[K, dim]`` to the densities of its rows, an array of shape ``[K, ]``.
+        
+        If ``is_ensemble = 1``, each of the ``n_samples`` realizations has its own density, e.g., the transition density of a member of an ensemble of Markov chains.
+        Then, ``pdf`` is always called with ``K = n_samples``, and row ``k`` is to be evaluated by the density of realization ``k``.
+    M : : number greater than 1
+        Bound on the ratio of the desired and proposal densities, see :func:`~utilities.rej_sampling_rvs`.
+    n_samples : : natural number
+        Number of realizations.
+    max_iters : : natural number
+        Maximal number of proposals per realization. Realizations that got no accepted proposal are set to their proposals with the largest acceptance ratio, with a warning.
+    is_ensemble : : 0 or 1
+        See ``pdf``.
+        
+    Returns
+    -------
+    samples : : array of shape ``[n_samples, dim]``
+    
+    """
+    samples = np.zeros([n_samples, dim])
+    is_accepted = np.zeros(n_samples, dtype=bool)
+    
+    samples_best = np.zeros([n_samples, dim])
+    ratios_best = np.full(n_samples, -np.inf)
+    
+    n_proposals = 0
     
-        unif_sample = rand()
+    while not is_accepted.all() and n_proposals < max_iters:
+        if is_ensemble:
+            # One proposal per realization, evaluated by the respective densities
+            proposal_samples = np.random.randn(n_samples, dim)
+            ratios = pdf(proposal_samples) / M / _std_normal_pdf(proposal_samples)
+            
+            is_new = ~is_accepted & ( rand(n_samples) < ratios )
+            samples[is_new] = proposal_samples[is_new]
+            is_accepted |= is_new
+            
+            is_better = ~is_accepted & ( ratios > ratios_best )
+            samples_best[is_better] = proposal_samples[is_better]
+            ratios_best[is_better] = ratios[is_better]
+            
+            n_proposals += 1
         
-        if unif_sample < pdf(proposal_sample) / M / normal_RV.pdf(proposal_sample):
-            return proposal_sample
+        else:
+            # Block of i.i.d. proposals, expected to suffice for the remaining realizations
+            n_remaining = n_samples - np.sum(is_accepted)
+            block_size = int(np.ceil(1.2 * M * n_remaining)) + 1
+            
+            proposal_samples = np.random.randn(block_size, dim)
+            ratios = pdf(proposal_samples) / M / _std_normal_pdf(proposal_samples)
+            
+            accepted_samples = proposal_samples[rand(block_size) < ratios][:n_remaining]
+            idx_free = np.flatnonzero(~is_accepted)[:accepted_samples.shape[0]]
+            samples[idx_free] = accepted_samples
+            is_accepted[idx_free] = True
+            
+            k_best = np.argmax(ratios)
+            if ratios[k_best] > ratios_best[0]:
+                samples_best[:] = proposal_samples[k_best]
+                ratios_best[:] = ratios[k_best]
+            
+            n_proposals += block_size / n_remaining
+    
+    if not is_accepted.all():
+        warnings.warn('Rejection sampling did not accept any proposal for ' + str(np.sum(~is_accepted)) + ' realizations. Using the most likely proposals')
+        samples[~is_accepted] = samples_best[~is_accepted]
+    
+    return samples
         
 def to_col_vec(argin):
     """
@@ -81,19 +185,71 @@ def push_vec(matrix, vec):
 def uptria2vec(mat):
     """
     Convert upper triangular square sub-matrix to column vector.
+    Elements are taken row by row.
     
     """    
     n = mat.shape[0]
+            
+    return mat[np.triu_indices(n)]
+
+class FeatureMap:
+    """
+    Quadratic feature map (regressor) of linearly parametrized models, e.g., critics and actors of :mod:`~controllers`.
     
-    vec = np.zeros( (int(n*(n+1)/2)) )
+    Index arrays are computed once at construction, so that features are evaluated without Python loops, for single arguments of shape ``[dim, ]`` as well as for batches of shape ``[L, dim]``.
     
-    k = 0
-    for i in range(n):
-        for j in range(i, n):
-            vec[k] = mat[i, j]
-            k += 1
+    Attributes
+    ----------
+    struct : : string
+        Structure of features of an argument :math:`\\chi`:
             
-    return vec
+        | ``quad-lin`` : quadratic-linear, i.e., the upper triangle of :math:`\\chi \\chi^\\top` followed by :math:`\\chi`
+        | ``quadratic`` : quadratic, i.e., the upper triangle of :math:`\\chi \\chi^\\top`
+        | ``quad-nomix`` : quadratic, no mixed terms, i.e., :math:`\\chi^2` element-wise
+        | ``quad-mix`` : for :math:`\\chi = [y, u]`, quadratic with mixed terms only between :math:`y` and :math:`u`, i.e., :math:`y^2`, :math:`y \\otimes u`, :math:`u^2`
+        
+    dim : : natural number
+        Dimension of the argument.
+    dim_mix : : natural number
+        Dimension of :math:`u` in ``quad-mix``, i.e., of the trailing part of the argument.
+    dim_features : : natural number
+        Number of features.
+    
+    """
+    def __init__(self, struct, dim, dim_mix=0):
+        self.struct = struct
+        self.dim = dim
+        self.dim_mix = dim_mix
+        
+        self.idx_rows, self.idx_cols = np.triu_indices(dim)
+        
+        if struct == 'quad-lin':
+            self.dim_features = int( ( dim + 1 ) * dim / 2 + dim )
+        elif struct == 'quadratic':
+            self.dim_features = int( ( dim + 1 ) * dim / 2 )
+        elif struct == 'quad-nomix':
+            self.dim_features = dim
+        elif struct == 'quad-mix':
+            self.dim_features = int( ( dim - dim_mix ) + ( dim - dim_mix ) * dim_mix + dim_mix )
+        else:
+            raise ValueError('Unknown feature structure: ' + str(struct))
+    
+    def __call__(self, chi):
+        """
+        Features of ``chi`` of shape ``[dim, ]``, resp., ``[L, dim]``. Returns an array of shape ``[dim_features, ]``, resp., ``[L, dim_features]``.
+        
+        """
+        if self.struct == 'quad-lin':
+            return np.concatenate([ chi[..., self.idx_rows] * chi[..., self.idx_cols], chi ], axis=-1)
+        elif self.struct == 'quadratic':
+            return chi[..., self.idx_rows] * chi[..., self.idx_cols]
+        elif self.struct == 'quad-nomix':
+            return chi * chi
+        elif self.struct == 'quad-mix':
+            y = chi[..., :self.dim - self.dim_mix]
+            u = chi[..., self.dim - self.dim_mix:]
+            y_kron_u = np.reshape( y[..., :, np.newaxis] * u[..., np.newaxis, :], chi.shape[:-1] + (-1,) )
+            return np.concatenate([ y**2, y_kron_u, u**2 ], axis=-1)
 
 class ZOH:
     """
@@ -143,6 +299,97 @@ class DFilter:
                 bufferFiltered[k,:], self.zi[k] = signal.lfilter(self.Num, self.Den, self.buffer[k,:], zi=self.zi[k, :])
         return bufferFiltered[-1,:]
     
+class CtrlStats:
+    """
+    Statistics of the control actions computed by a controller, recorded per sample into a ring buffer.
+    
+    Each record has the fields ``fields``: wall time of the action computation (in seconds), numbers of optimizer iterations and function evaluations,
+    solver status and cost value. Fields that do not apply to a controller are NaN.
+    
+    Status codes:
+        
+    .. list-table:: Status codes
+       :widths: 10 90
+       :header-rows: 1
+    
+       * - Code
+         - Description
+       * - 0
+         - Success
+       * - 1
+         - Solver failed, a default action was used
+       * - 2
+         - Solver stopped without convergence, e.g., by the iteration or time limit, its last iterate was used
+    
+    Attributes
+    ----------
+    buffer : : array of shape ``[buffer_size, 5]``
+        Records. Once ``buffer_size`` records are made, the oldest ones are overwritten.
+    count : : natural number
+        Total number of records made.
+    
+    """
+    
+    fields = ['wall_time', 'nit', 'nfev', 'status', 'cost']
+    
+    def __init__(self, buffer_size=10000):
+        self.buffer = np.full([buffer_size, len(self.fields)], np.nan)
+        self.count = 0
+        
+    def reset(self):
+        self.buffer[:] = np.nan
+        self.count = 0
+        
+    def record(self, wall_time, nit=np.nan, nfev=np.nan, status=0, cost=np.nan):
+        row = self.buffer[self.count % self.buffer.shape[0]]
+        row[0] = wall_time
+        row[1] = nit
+        row[2] = nfev
+        row[3] = status
+        row[4] = cost
+        self.count += 1
+        
+    def data(self):
+        """
+        Stored records in chronological order.
+        
+        """
+        buffer_size = self.buffer.shape[0]
+        
+        if self.count <= buffer_size:
+            return self.buffer[:self.count]
+        else:
+            return np.roll(self.buffer, -(self.count % buffer_size), axis=0)
+        
+    def summary(self, percentiles=[50, 90, 99]):
+        """
+        Summary of the stored records: numbers of records and failures, and, for the wall time, iterations, function evaluations and cost,
+        the mean, the maximum and the percentiles ``percentiles`` as keys ``p50`` etc.
+        Statistics of fields that were never recorded are NaN.
+        
+        """
+        data = self.data()
+        
+        summary = {'calls': self.count,
+                   'failures': int(np.sum(data[:, 3] == 1)),
+                   'unconverged': int(np.sum(data[:, 3] == 2))}
+        
+        for k, field in enumerate(self.fields):
+            if field == 'status':
+                continue
+            
+            col = data[:, k]
+            col = col[~np.isnan(col)]
+            
+            if col.size == 0:
+                summary[field] = {key: np.nan for key in ['mean', 'max'] + ['p' + str(q) for q in percentiles]}
+            else:
+                summary[field] = {'mean': float(np.mean(col)), 'max': float(np.max(col))}
+                for q, val in zip(percentiles, np.percentile(col, percentiles)):
+                    summary[field]['p' + str(q)] = float(val)
+        
+        return summary
+    
 def dss_sim(A, B, C, D, uSqn, x0, y0):
     """
     Simulate output response of a discrete-time state-space model.
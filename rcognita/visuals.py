@@ -303,7 +303,11 @@ class Animator3WRobot(Animator):
         if t >= self.t1:  
             if self.is_print_sim_step:
                     print('.....................................Run {run:2d} done.....................................'.format(run = self.run_curr))
+                    self.logger.reporter.reset()
                 
+            if self.is_log_data:
+                self.logger.close(self.datafile_curr)
+            
             self.run_curr += 1
             
             if self.run_curr > self.Nruns:
@@ -551,6 +555,10 @@ class Animator3WRobotNI(Animator):
         if t >= self.t1:  
             if self.is_print_sim_step:
                     print('.....................................Run {run:2d} done.....................................'.format(run = self.run_curr))  
+                    self.logger.reporter.reset()
+            
+            if self.is_log_data:
+                self.logger.close(self.datafile_curr)
             
             self.run_curr += 1
                     
@@ -764,7 +772,11 @@ class Animator2Tank(Animator):
         if t >= self.t1:  
             if self.is_print_sim_step:
                     print('.....................................Run {run:2d} done.....................................'.format(run = self.run_curr))
+                    self.logger.reporter.reset()
                 
+            if self.is_log_data:
+                self.logger.close(self.datafile_curr)
+            
             self.run_curr += 1
             
             if self.run_curr > self.Nruns:
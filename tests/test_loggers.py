@@ -0,0 +1,40 @@
+import numpy as np
+
+from rcognita.loggers import Logger3WRobotNI, load_trajectory
+
+
+def log_episode(logger, datafile, header, n_rows):
+    logger.write_header(datafile, header)
+
+    for k in range(n_rows):
+        logger.log_data_row(datafile, 0.1 * k, 1.0, 2.0, 0.3, 0.5, 0.5 * k, [0.2, 0.1])
+
+    logger.close(datafile)
+
+
+def test_write_header_starts_new_trajectory_episode(tmp_path):
+    datafile = str(tmp_path / 'run.npy')
+
+    logger = Logger3WRobotNI()
+    log_episode(logger, datafile, {'episode': 1}, 20)
+    log_episode(logger, datafile, {'episode': 2}, 15)
+
+    header, data = load_trajectory(datafile)
+
+    assert header == {'episode': 2}
+    assert data.shape == (15, )
+    assert np.allclose(data['t'], 0.1 * np.arange(15))
+
+
+def test_write_header_starts_new_csv_episode(tmp_path):
+    datafile = str(tmp_path / 'run.csv')
+
+    logger = Logger3WRobotNI()
+    log_episode(logger, datafile, {'episode': 1}, 20)
+    log_episode(logger, datafile, {'episode': 2}, 15)
+
+    with open(datafile) as infile:
+        lines = infile.read().splitlines()
+
+    assert lines[0] == 'episode,2'
+    assert len(lines) == 2 + 15
@@ -0,0 +1,39 @@
+import numpy as np
+
+from rcognita.controllers import CtrlLQR
+from rcognita.systems import Sys3WRobotNI
+
+sampling_time = 0.1
+
+
+def step(x, u):
+    return x + sampling_time * np.array([u[0] * np.cos(x[2]), u[0] * np.sin(x[2]), u[1]])
+
+
+def final_error(ctrl, goal, is_scheduled, n_steps=200):
+    ctrl.reset(0)
+    x = np.zeros(3)
+
+    for _ in range(n_steps):
+        state_error = x - goal
+        state_error[2] = (state_error[2] + np.pi) % (2 * np.pi) - np.pi
+        u = ctrl.compute_action(state_error, x if is_scheduled else None)
+        x = step(x, u)
+
+    return np.linalg.norm(x[:2] - goal[:2])
+
+
+def test_scheduled_gain_beats_fixed_gain_away_from_zero_heading():
+    my_sys = Sys3WRobotNI(sys_type="diff_eqn", dim_state=3, dim_input=2, dim_output=3, dim_disturb=0)
+    A, B = my_sys.linearize_discr(np.zeros(3), np.array([1.0, 0.0]), sampling_time)
+
+    ctrl = CtrlLQR(A, B, np.diag([10, 10, 1.0]), np.diag([0.1, 0.1]), sampling_time,
+                   sys_linearize=my_sys.linearize_discr, sched_headings=72, sched_speeds=np.linspace(0.1, 1, 10))
+
+    rng = np.random.default_rng(0)
+    goals = [np.array([*rng.uniform(-3, 3, 2), rng.uniform(-np.pi, np.pi)]) for _ in range(10)]
+
+    errors_fixed = [final_error(ctrl, goal, is_scheduled=False) for goal in goals]
+    errors_scheduled = [final_error(ctrl, goal, is_scheduled=True) for goal in goals]
+
+    assert np.mean(errors_scheduled) < 0.5 * np.mean(errors_fixed)
@@ -0,0 +1,24 @@
+import numpy as np
+
+from rcognita.controllers import CtrlMPC
+
+sampling_time = 0.1
+
+
+def test_rti_solve_time_within_budget():
+    time_budget = 5e-3
+
+    ctrl = CtrlMPC(N=60, sampling_time=sampling_time, solver_type='rti', rti_max_iter=5, time_budget=time_budget)
+
+    x = np.array([-2.0, -1.5, 0.3])
+    x_ref = np.zeros(3)
+    times = []
+
+    for k in range(200):
+        u = ctrl.compute_action(k * sampling_time, np.concatenate([x, x_ref]))
+        times.append(ctrl.opt_stats['time_last'])
+        x = x + sampling_time * np.array([u[0] * np.cos(x[2]), u[0] * np.sin(x[2]), u[1]])
+
+    # The first sample has no warm start and always iterates
+    assert np.percentile(times[1:], 99) <= time_budget + 1e-3
+    assert np.linalg.norm(x[:2]) < 0.1
@@ -0,0 +1,37 @@
+import numpy as np
+
+from rcognita.controllers import CtrlNominal3WRobot, CtrlNominal3WRobotNI
+
+ctrl_bnds = np.array([[-2.2, 2.2], [-2.84, 2.84]])
+
+
+def test_batch_actions_match_single_robot_actions():
+    observations = np.random.default_rng(0).normal(scale=2, size=(50, 3))
+
+    ctrl = CtrlNominal3WRobotNI(ctrl_gain=5, ctrl_bnds=ctrl_bnds, t0=0, sampling_time=0.1)
+
+    actions_vanila = np.array([ctrl.compute_action_vanila(observation) for observation in observations])
+
+    # The bounds must bind for some robots, so that clipping is compared too
+    assert np.any(np.abs(actions_vanila) > ctrl_bnds[:, 1])
+
+    assert np.allclose(ctrl.compute_action_vanila_batch(observations), actions_vanila)
+
+    actions = []
+    for observation in observations:
+        ctrl.reset(0)
+        actions.append(ctrl.compute_action(0.1, observation))
+
+    ctrl.reset(0)
+    assert np.allclose(ctrl.compute_action_batch(0.1, observations), actions)
+
+
+def test_theta_memo_can_be_disabled():
+    observation = np.array([1.0, -0.5, 0.3, 0.1, -0.2])
+
+    ctrl = CtrlNominal3WRobot(10, 1, theta_memo_size=0)
+    ctrl_memo = CtrlNominal3WRobot(10, 1, theta_memo_size=1)
+
+    assert np.isclose(ctrl.compute_LF(observation), ctrl_memo.compute_LF(observation))
+    assert len(ctrl.theta_memo) == 0
+    assert len(ctrl_memo.theta_memo) == 1
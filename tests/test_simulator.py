@@ -0,0 +1,70 @@
+import numpy as np
+import scipy as sp
+
+from rcognita import simulator, systems
+
+dt = 0.1
+n_steps = 50
+state_init = np.array([1.0, 2.0, 0.3])
+
+
+def make_sys():
+    my_sys = systems.Sys3WRobotNI(sys_type="diff_eqn", dim_state=3, dim_input=2, dim_output=3, dim_disturb=0,
+                                  ctrl_bnds=np.array([[-2.2, 2.2], [-2.84, 2.84]]))
+    my_sys.receive_action(np.array([0.8, 1.5]))
+
+    return my_sys
+
+
+def make_simulator(my_sys, **kwargs):
+    return simulator.Simulator("diff_eqn", my_sys.closed_loop_rhs, my_sys.out, state_init, t1=n_steps * dt, dt=dt, **kwargs)
+
+
+def run(my_simulator):
+    ts, states = [], []
+
+    for _ in range(n_steps):
+        my_simulator.sim_step()
+        ts.append(my_simulator.t)
+        states.append(my_simulator.state.copy())
+
+    return np.array(ts), np.array(states)
+
+
+def rk45_reference(my_sys, ts):
+    sol = sp.integrate.solve_ivp(my_sys.closed_loop_rhs, [0, ts[-1]], state_init, method='RK45', t_eval=ts, rtol=1e-12, atol=1e-12)
+
+    return sol.y.T
+
+
+def test_fixed_step_solver_matches_rk45():
+    my_sys = make_sys()
+
+    # Two RK4 integration steps per simulation step
+    my_simulator = make_simulator(my_sys, max_step=dt / 2, integrator='rk4')
+    assert my_simulator.ODE_solver.n_substeps == 2
+
+    ts, states = run(my_simulator)
+
+    assert np.allclose(ts, dt * np.arange(1, n_steps + 1), rtol=0, atol=1e-12)
+    assert np.allclose(states, rk45_reference(my_sys, ts), rtol=0, atol=1e-6)
+
+    # A step not dividing dt is rounded up to a whole number of integration steps
+    assert make_simulator(my_sys, max_step=0.03, integrator='rk4').ODE_solver.n_substeps == 4
+
+    # The tolerance above tells the schemes apart
+    _, states_euler = run(make_simulator(my_sys, max_step=dt / 2, integrator='euler'))
+    assert not np.allclose(states_euler, rk45_reference(my_sys, ts), rtol=0, atol=1e-6)
+
+
+def test_reset_reproduces_trajectory():
+    my_sys = make_sys()
+
+    for kwargs in [{'integrator': 'rk4'}, {'first_step': 1e-4}, {'first_step': None}]:
+        my_simulator = make_simulator(my_sys, **kwargs)
+
+        _, states = run(my_simulator)
+        my_simulator.reset()
+        _, states_after_reset = run(my_simulator)
+
+        assert np.array_equal(states, states_after_reset)